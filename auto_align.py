@@ -0,0 +1,224 @@
+import argparse
+import sys
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from sessions import dir_match, load_match
+
+alignment_columns = [
+    "db_file",
+    "aria_file",
+    "scale",
+    "offset",
+    "db_offset",
+    "aria_offset",
+    "confidence",
+]
+
+
+def accel_magnitude(imu_data):
+    """Gravity-free accel magnitude of (timestamp, accX, accY, accZ) rows"""
+    magnitude = np.linalg.norm(imu_data[:, 1:4], axis=1)
+    return magnitude - np.median(magnitude)
+
+
+def decimate(timestamps, values, start, rate, length):
+    """Averages `values` into `length` bins of 1 / `rate` seconds from `start`"""
+    bins = np.floor((timestamps - start) * rate).astype(np.int64)
+    inside = (bins >= 0) & (bins < length)
+    sums = np.bincount(bins[inside], weights=values[inside], minlength=length)
+    counts = np.bincount(bins[inside], minlength=length)
+    return np.divide(sums, counts, out=np.zeros(length), where=counts > 0)
+
+
+def bin_means(timestamps, values, start, rate):
+    """Centers and means of the non-empty 1 / `rate` second bins from `start`"""
+    bins = np.floor((timestamps - start) * rate).astype(np.int64)
+    counts = np.bincount(bins)
+    sums = np.bincount(bins, weights=values)
+    full = counts > 0
+    return start + (np.flatnonzero(full) + 0.5) / rate, sums[full] / counts[full]
+
+
+def cross_correlate(a, b):
+    """Circularly padded FFT cross-correlation, c[k] = sum_n a[n + k] * b[n]"""
+    n = 1 << int(np.ceil(np.log2(len(a) + len(b))))
+    c = np.fft.irfft(np.fft.rfft(a, n) * np.conj(np.fft.rfft(b, n)), n)
+    lags = np.arange(n)
+    lags[lags >= n // 2] -= n
+    return lags, c
+
+
+def sample_period(timestamps) -> float:
+    """Median step between distinct timestamps, ignoring repeated samples"""
+    steps = np.diff(np.unique(timestamps))
+    if len(steps) == 0:
+        raise ValueError("Need IMU samples at two or more distinct timestamps")
+    return float(np.median(steps))
+
+
+def pearson(phone_t, phone_mag, aria_t, aria_mag, shift):
+    """Correlation of the phone signal against the Aria signal `shift` s later"""
+    query = phone_t + shift
+    inside = (query >= aria_t[0]) & (query <= aria_t[-1])
+    if np.count_nonzero(inside) < 2:
+        return 0.0
+    x = phone_mag[inside]
+    y = np.interp(query[inside], aria_t, aria_mag)
+    x = x - x.mean()
+    y = y - y.mean()
+    denom = np.sqrt(np.dot(x, x) * np.dot(y, y))
+    return float(np.dot(x, y) / denom) if denom > 0 else 0.0
+
+
+def estimate_offset(
+    db_imu_data,
+    aria_imu_data,
+    coarse_rate=10.0,
+    max_offset: Optional[float] = None,
+    exclusion=2.0,
+) -> Tuple[float, float]:
+    """
+    Shift s (seconds) such that the Aria accel at t + s matches the phone accel
+    at t, and a confidence in [0, 1]. The shift is found on `coarse_rate`
+    decimated magnitudes with an FFT cross-correlation and refined at the phone
+    sample period with a parabolic fit. Confidence is the refined correlation
+    scaled by the margin of the coarse peak over the best peak further than
+    `exclusion` seconds away.
+    """
+    return match_magnitudes(
+        db_imu_data[:, 0],
+        accel_magnitude(db_imu_data),
+        aria_imu_data[:, 0],
+        accel_magnitude(aria_imu_data),
+        coarse_rate,
+        max_offset,
+        exclusion,
+    )
+
+
+def match_magnitudes(
+    phone_t,
+    phone_mag,
+    aria_t,
+    aria_mag,
+    coarse_rate=10.0,
+    max_offset: Optional[float] = None,
+    exclusion=2.0,
+) -> Tuple[float, float]:
+    """estimate_offset on accel magnitudes sampled at `phone_t` and `aria_t`"""
+    start = min(phone_t[0], aria_t[0])
+    length = int(np.ceil((max(phone_t[-1], aria_t[-1]) - start) * coarse_rate)) + 1
+    phone_coarse = decimate(phone_t, phone_mag, start, coarse_rate, length)
+    aria_coarse = decimate(aria_t, aria_mag, start, coarse_rate, length)
+    lags, c = cross_correlate(aria_coarse, phone_coarse)
+    if max_offset is not None:
+        c[np.abs(lags) > max_offset * coarse_rate] = -np.inf
+    peak = int(np.argmax(c))
+    coarse_shift = lags[peak] / coarse_rate
+    side = np.abs(lags - lags[peak]) > exclusion * coarse_rate
+    side_peak = max(c[side & np.isfinite(c)].max(initial=0.0), 0.0)
+    margin = 1.0 - side_peak / c[peak] if c[peak] > 0 else 0.0
+
+    step = sample_period(phone_t)
+    shifts = coarse_shift + np.arange(-2 / coarse_rate, 2 / coarse_rate + step, step)
+    r = np.array([pearson(phone_t, phone_mag, aria_t, aria_mag, s) for s in shifts])
+    best = int(np.argmax(r))
+    shift = shifts[best]
+    if 0 < best < len(r) - 1:
+        denom = r[best - 1] - 2 * r[best] + r[best + 1]
+        if denom < 0:
+            shift += 0.5 * step * (r[best - 1] - r[best + 1]) / denom
+    return float(shift), float(max(r[best], 0.0) * margin)
+
+
+def refine_shift(
+    db_imu_data,
+    aria_imu_data,
+    shift: float,
+    start: float,
+    end: float,
+    points=2000,
+    fine_points=20000,
+    max_search=5.0,
+    min_rate=10.0,
+) -> Tuple[float, float]:
+    """
+    Refines a shift s as returned by estimate_offset using only the phone
+    samples in [start, end] and the Aria samples they can reach, searched up to
+    a quarter of the window and at most `max_search` seconds either way. The
+    coarse search runs on about `points` bins and the fine one on about
+    `fine_points`, neither below `min_rate` nor above the phone rate, so the
+    cost stays bounded however far the view is zoomed out.
+    """
+    width = end - start
+    search = min(width / 4, max_search)
+    phone_t, aria_t = db_imu_data[:, 0], aria_imu_data[:, 0]
+    lo, hi = np.searchsorted(phone_t, [start, end])
+    aria_lo, aria_hi = np.searchsorted(
+        aria_t, [start + shift - search, end + shift + search]
+    )
+    if hi - lo < 2 or aria_hi - aria_lo < 2 or phone_t[lo] == phone_t[hi - 1]:
+        return shift, 0.0
+    phone_rate = 1 / sample_period(phone_t[lo:hi])
+    coarse_rate = min(max(points / width, min_rate), phone_rate)
+    fine_rate = min(max(fine_points / width, coarse_rate), phone_rate)
+    phone = phone_t[lo:hi], accel_magnitude(db_imu_data[lo:hi])
+    aria = aria_t[aria_lo:aria_hi] - shift, accel_magnitude(
+        aria_imu_data[aria_lo:aria_hi]
+    )
+    if fine_rate < phone_rate:
+        phone = bin_means(*phone, start, fine_rate)
+        aria = bin_means(*aria, start - search, fine_rate)
+        if len(phone[0]) < 2 or len(aria[0]) < 2:
+            return shift, 0.0
+    residual, confidence = match_magnitudes(*phone, *aria, coarse_rate, search)
+    return shift + residual, confidence
+
+
+def auto_align(
+    match: Tuple[str, str], max_offset: Optional[float] = None, clock_segments=1
+):
+    """alignment.csv row of a (db_file, aria_file) match"""
+    db_imu_data, aria_imu_data, scale, offset = load_match(match, clock_segments)
+    shift, confidence = estimate_offset(
+        db_imu_data, aria_imu_data, max_offset=max_offset
+    )
+    return {
+        "db_file": match[0].split("/")[-1],
+        "aria_file": match[1].split("/")[-1],
+        "scale": scale,
+        "offset": offset,
+        "db_offset": max(shift, 0.0),
+        "aria_offset": max(-shift, 0.0),
+        "confidence": confidence,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dirs", nargs="+")
+    parser.add_argument("--max-offset", type=float, default=None)
+    parser.add_argument("--min-confidence", type=float, default=0.1)
+    parser.add_argument(
+        "--clock-segments",
+        type=int,
+        default=1,
+        help="map Aria time with a piecewise-linear clock, pass the same to *_gt.py",
+    )
+    args = parser.parse_args()
+    print(",".join(alignment_columns))
+    for dir in args.dirs:
+        matches = dir_match(Path(dir).resolve())
+        assert len(matches) > 0
+        for match in matches:
+            row = auto_align(match, args.max_offset, args.clock_segments)
+            print(",".join([str(row[column]) for column in alignment_columns]))
+            if row["confidence"] < args.min_confidence:
+                print(
+                    f"Low confidence {row['confidence']:.2f}: "
+                    f"{row['aria_file']}->{row['db_file']}",
+                    file=sys.stderr,
+                )
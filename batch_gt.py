@@ -0,0 +1,168 @@
+import argparse
+import logging
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+
+import ble_gt
+import imu_gt
+import metrics
+from loaders import read_alignment
+from writers import binary_formats
+
+calib = None
+
+
+def init_worker():
+    global calib
+    calib = imu_gt.load_calib()
+
+
+def find_jobs(paths: List[Path]) -> List[Tuple[Path, int, Dict[str, str]]]:
+    """Every (alignment.csv, truth_idx, match) of directories or alignment files"""
+    jobs = []
+    for path in paths:
+        alignment = path / "alignment.csv" if path.is_dir() else path
+        for truth_idx, match in enumerate(read_alignment(alignment)):
+            jobs.append((alignment, truth_idx, match))
+    return jobs
+
+
+def run_job(
+    alignment: Path,
+    truth_idx: int,
+    match,
+    imu_format: str,
+    ble_format: str,
+    clock_segments=0,
+    stride=1,
+    max_angle=None,
+) -> Tuple[float, Optional[str]]:
+    """Runs IMU and BLE GT for one match, returns the wall time and any traceback"""
+    start = time.time()
+    try:
+        R, T = calib
+        imu_gt.process_match(
+            alignment,
+            truth_idx,
+            match,
+            R,
+            T,
+            imu_format,
+            clock_segments,
+            stride,
+            max_angle,
+        )
+        ble_gt.process_match(
+            alignment, truth_idx, match, R, T, ble_format, clock_segments
+        )
+    except Exception:
+        return time.time() - start, traceback.format_exc()
+    return time.time() - start, None
+
+
+def run_measured_job(*args) -> Tuple[float, Optional[str], List[dict]]:
+    """run_job, profiled if enabled, also returning its metrics steps"""
+    alignment, truth_idx = args[:2]
+    metrics.collect()
+    elapsed, error = metrics.profiled(
+        f"{alignment.parent.name}_gt_{truth_idx}", run_job, *args
+    )
+    return elapsed, error, metrics.collect()
+
+
+def run(
+    paths: List[Path],
+    jobs=None,
+    imu_format="csv",
+    ble_format="vvk",
+    clock_segments=0,
+    stride=1,
+    max_angle=None,
+) -> int:
+    """
+    Processes every match of `paths` on a process pool and writes a
+    batch_gt_report.json per directory, returns the failure count
+    """
+    started = time.time()
+    matches = find_jobs(paths)
+    logging.info(f"Scheduling {len(matches)} matches from {len(paths)} directories")
+    failures = 0
+    entries: Dict[Path, List[dict]] = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as pool:
+        futures = {
+            pool.submit(
+                run_measured_job,
+                *match,
+                imu_format,
+                ble_format,
+                clock_segments,
+                stride,
+                max_angle,
+            ): match
+            for match in matches
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            alignment, truth_idx, match = futures[future]
+            name = f"{alignment.parent.name}/{truth_idx} ({match['aria_file']})"
+            try:
+                elapsed, error, steps = future.result()
+            except Exception:
+                elapsed, error, steps = 0.0, traceback.format_exc(), []
+            entries.setdefault(alignment.parent, []).append(
+                {
+                    "match": truth_idx,
+                    "aria_file": match["aria_file"],
+                    "seconds": elapsed,
+                    "status": "ok" if error is None else "failed",
+                    "steps": steps,
+                }
+            )
+            if error is None:
+                logging.info(f"Finished {name} in {elapsed:.1f}s")
+            else:
+                failures += 1
+                logging.error(f"Failed {name} after {elapsed:.1f}s\n{error}")
+    for dir, dir_entries in entries.items():
+        report = metrics.write_report(dir, "batch_gt_report.json", dir_entries, started)
+        logging.info(f"Wrote {report}")
+    logging.info(f"{len(matches) - failures}/{len(matches)} matches succeeded")
+    return failures
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s",
+        level=logging.INFO,
+        datefmt="%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="directories or alignment.csv files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--format", default="csv", choices=["csv", *binary_formats])
+    parser.add_argument(
+        "--ble-format", default="vvk", choices=["vvk", "vvb", *binary_formats]
+    )
+    parser.add_argument("--clock-segments", type=int, default=0)
+    imu_gt.add_frame_arguments(parser)
+    parser.add_argument(
+        "--profile", metavar="DIR", help="write a cProfile .prof per match to DIR"
+    )
+    args = parser.parse_args()
+    metrics.set_profile_dir(args.profile)
+    failures = run(
+        [Path(path).resolve() for path in args.paths],
+        args.jobs,
+        args.format,
+        args.ble_format,
+        args.clock_segments,
+        args.stride,
+        args.max_angle,
+    )
+    sys.exit(1 if failures > 0 else 0)
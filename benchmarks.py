@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import synthetic
+from metrics import peak_rss_mb
+
+
+def bench_get_bezier_cubic(alignment: Path) -> Callable[[], int]:
+    import numpy as np
+
+    from bezier import get_bezier_cubic
+    from loaders import load_euroc, read_alignment
+
+    match = read_alignment(alignment)[0]
+    timestamps, positions, _ = load_euroc(
+        alignment.parent / (match["aria_file"] + ".euroc")
+    )
+    points = np.column_stack([timestamps, positions])
+    get_bezier_cubic(points[:10])
+    return lambda: len(get_bezier_cubic(points)) + 1
+
+
+def bench_bezier_fit(alignment: Path) -> Callable[[], int]:
+    from bezier import BezierSpline
+    from loaders import load_aria_imu, read_alignment
+
+    match = read_alignment(alignment)[0]
+    timestamps, imu = load_aria_imu(
+        alignment.parent / (match["aria_file"] + "_IMU_1.csv")
+    )
+    BezierSpline.fit(timestamps[:10], imu[:10])
+    return lambda: len(BezierSpline.fit(timestamps, imu)) + 1
+
+
+def bench_load_imu(alignment: Path) -> Callable[[], int]:
+    from loaders import read_alignment
+    from sessions import load_imu
+
+    def run():
+        rows = 0
+        for match in read_alignment(alignment):
+            db_imu_data, aria_imu_data = load_imu(
+                alignment.parent / match["db_file"],
+                alignment.parent / (match["aria_file"] + "_IMU_1.csv"),
+                float(match["scale"]),
+                float(match["offset"]),
+            )
+            rows += len(db_imu_data) + len(aria_imu_data)
+        return rows
+
+    return run
+
+
+def frame_spread(traj: Path, R_cam_rgb) -> float:
+    """
+    Median angle (degrees) between the aligned phone gyro orientations of a
+    traj and the phone orientations implied by its GT orientations
+    """
+    import numpy as np
+    from scipy.spatial.transform import Rotation
+
+    from imu_gt import R_rgb_phone
+    from loaders import read_columns
+
+    quats = read_columns(
+        traj,
+        ["orientX", "orientY", "orientZ", "orientW"]
+        + ["phoneGyroOrientX", "phoneGyroOrientY", "phoneGyroOrientZ"]
+        + ["phoneGyroOrientW"],
+    )
+    R_local_phone = Rotation.from_quat(quats[:, :4]) * (R_cam_rgb * R_rgb_phone)
+    errors = (R_local_phone.inv() * Rotation.from_quat(quats[:, 4:])).magnitude()
+    return float(np.degrees(np.median(errors)))
+
+
+def bench_imu_gt(alignment: Path) -> Callable[[], int]:
+    import imu_gt
+    from gt import clear_cache, get_cache_dir
+    from loaders import read_alignment, read_columns
+
+    R, T = imu_gt.load_calib()
+    # The frame alignment only measures something if the phone and GT agree
+    imu_gt.process(alignment, R, T)
+    spread = frame_spread(alignment.parent / "traj_0.csv", R)
+    assert spread < 1.0, f"Phone and GT frames disagree by {spread:.1f} degrees"
+
+    def run():
+        clear_cache(get_cache_dir(alignment))
+        imu_gt.process(alignment, R, T)
+        return sum(
+            len(read_columns(alignment.parent / f"traj_{i}.csv", ["timestamp"]))
+            for i in range(len(read_alignment(alignment)))
+        )
+
+    return run
+
+
+def bench_ble_gt(alignment: Path) -> Callable[[], int]:
+    import ble_gt
+    from fingerprints import read_vvk
+    from gt import clear_cache, get_cache_dir
+    from loaders import read_alignment
+
+    R, T = ble_gt.load_calib()
+
+    def run():
+        clear_cache(get_cache_dir(alignment))
+        ble_gt.process(alignment, R, T)
+        return sum(
+            len(read_vvk(alignment.parent / f"traj_{i}.vvk")[0])
+            for i in range(len(read_alignment(alignment)))
+        )
+
+    return run
+
+
+def bench_split_imu(alignment: Path) -> Callable[[], int]:
+    import imu_gt
+    import split_imu
+
+    files = sorted(alignment.parent.glob("traj_*.csv"))
+    if len(files) == 0:
+        imu_gt.process(alignment, *imu_gt.load_calib())
+        files = sorted(alignment.parent.glob("traj_*.csv"))
+    return lambda: sum(split_imu.split_files(files))
+
+
+def bench_split_ble(alignment: Path) -> Callable[[], int]:
+    import ble_gt
+    import split_ble
+
+    files = sorted(alignment.parent.glob("traj_*.vvk"))
+    if len(files) == 0:
+        ble_gt.process(alignment, *ble_gt.load_calib())
+        files = sorted(alignment.parent.glob("traj_*.vvk"))
+    return lambda: sum(split_ble.split_files(files))
+
+
+# In run order, the split benchmarks split what the GT benchmarks wrote, run
+# alone they write the GT themselves first
+benchmarks = {
+    "get_bezier_cubic": bench_get_bezier_cubic,
+    "bezier_fit": bench_bezier_fit,
+    "load_imu": bench_load_imu,
+    "imu_gt": bench_imu_gt,
+    "ble_gt": bench_ble_gt,
+    "split_imu": bench_split_imu,
+    "split_ble": bench_split_ble,
+}
+
+
+def measure(name: str, alignment: Path, repeat: int) -> Dict[str, float]:
+    """
+    Runs a benchmark in this (fresh) process: sets it up, then times `repeat`
+    runs. Returns the best time, its rows/s and the peak RSS of the process.
+    """
+    with open(os.devnull, "w") as devnull:
+        with redirect_stdout(devnull), redirect_stderr(devnull):
+            run = benchmarks[name](alignment)
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = run()
+                times.append(time.perf_counter() - start)
+    seconds = min(times)
+    return {
+        "benchmark": name,
+        "seconds": seconds,
+        "rows": rows,
+        "rows_per_s": rows / seconds if seconds > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(file: Path) -> List[Dict]:
+    if not file.exists():
+        return []
+    with open(file, "r") as f:
+        return [json.loads(line) for line in f if line.strip() != ""]
+
+
+def run(
+    names: List[str],
+    data: Path,
+    output: Path,
+    repeat=3,
+    sessions=1,
+    duration=600.0,
+    seed=0,
+    **kwargs,
+) -> List[Dict]:
+    """
+    Generates a synthetic session set in `data` unless it has an alignment.csv,
+    runs each benchmark in its own process so that peak RSS is per benchmark,
+    and appends the results to the `output` JSON lines history.
+    """
+    alignment = data / "alignment.csv"
+    params = {"sessions": sessions, "duration": duration, "seed": seed, **kwargs}
+    if not alignment.exists():
+        synthetic.generate(data, sessions, duration, seed, **kwargs)
+    # GT benchmarks clear this cache before every run so each fits the splines
+    os.environ["ARIA_GT_CACHE_DIR"] = tempfile.mkdtemp(prefix="gt_cache_")
+
+    history = read_history(output)
+    commit = git_commit()
+    results = []
+    for name in names:
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+            result = pool.submit(measure, name, alignment, repeat).result()
+        result.update(commit=commit, time=time.time(), params=params)
+        previous = [
+            row
+            for row in history
+            if row["benchmark"] == name and row["params"] == params
+        ]
+        change = ""
+        if len(previous) > 0 and previous[-1]["rows_per_s"] > 0:
+            ratio = result["rows_per_s"] / previous[-1]["rows_per_s"]
+            change = f" ({ratio - 1:+.1%} vs {previous[-1]['commit']})"
+        print(
+            f"{name:<18}{result['seconds']:9.3f}s "
+            f"{result['rows_per_s']:14,.0f} rows/s "
+            f"{result['peak_rss_mb']:8.1f} MiB{change}"
+        )
+        results.append(result)
+        with open(output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Times the pipeline stages on synthetic sessions"
+    )
+    parser.add_argument(
+        "benchmarks", nargs="*", help=f"any of {', '.join(benchmarks)} (all)"
+    )
+    parser.add_argument(
+        "--data", help="session directory, generated if it has no alignment.csv"
+    )
+    parser.add_argument("--output", default="benchmarks.jsonl")
+    parser.add_argument("--repeat", type=int, default=3)
+    synthetic.add_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(benchmarks)
+    if len(unknown) > 0:
+        parser.error(f"unknown benchmarks {', '.join(sorted(unknown))}")
+    data = Path(args.data or tempfile.mkdtemp(prefix="sessions_")).resolve()
+    run(
+        args.benchmarks or list(benchmarks),
+        data,
+        Path(args.output).resolve(),
+        args.repeat,
+        args.sessions,
+        args.duration,
+        args.seed,
+        **synthetic.session_kwargs(args),
+    )
@@ -5,69 +5,76 @@ from pathlib import Path
 import numpy as np
 from matplotlib import pyplot as plt
 from numba import float64, jit
+from numba.types import UniTuple
 
+from loaders import load_euroc, load_phone_imu
 
-@jit(
-    float64[:](float64[:], float64[:], float64[:], float64[:]),
-    nopython=True,
-    nogil=True,
-)
-def TDMAsolver(a, b, c, d):
+
+@jit(float64[:, :](float64[:, :]), nopython=True, nogil=True)
+def solve_bezier_a(points):
     """
-    TDMA solver, a b c d can be NumPy array type or Python list type.
-    refer to http://en.wikipedia.org/wiki/Tridiagonal_matrix_algorithm
-    and to http://www.cfd-online.com/Wiki/Tridiagonal_matrix_algorithm_-_TDMA_(Thomas_algorithm)
+    First control points A of the C2 cubic Bezier through every column of the
+    (n + 1, d) `points` at once. The tridiagonal system only depends on n, so
+    it is factorized once and the d right-hand sides are swept together.
+    Raises ValueError for fewer than 2 points.
     """
-    nf = len(d)  # number of equations
-    ac, bc, cc, dc = a.copy(), b.copy(), c.copy(), d.copy()
-    for it in range(1, nf):
-        mc = ac[it - 1] / bc[it - 1]
-        bc[it] = bc[it] - mc * cc[it - 1]
-        dc[it] = dc[it] - mc * dc[it - 1]
-
-    xc = bc
-    xc[-1] = dc[-1] / bc[-1]
+    n = points.shape[0] - 1
+    d = points.shape[1]
+    if n < 1:
+        raise ValueError("A Bezier spline needs at least 2 points")
+    A = np.empty((n, d))
+    if n == 1:
+        # Both end conditions at once: the straight segment, A at a third
+        for k in range(d):
+            A[0, k] = (2 * points[0, k] + points[1, k]) / 3
+        return A
 
-    for il in range(nf - 2, -1, -1):
-        xc[il] = (dc[il] - cc[il] * xc[il + 1]) / bc[il]
+    # forward sweep of the shared system a = 1 (2 last), b = 4 (2 first, 7 last)
+    for i in range(n):
+        for k in range(d):
+            A[i, k] = 2 * (2 * points[i, k] + points[i + 1, k])
+    for k in range(d):
+        A[0, k] = points[0, k] + 2 * points[1, k]
+        A[n - 1, k] = 8 * points[n - 1, k] + points[n, k]
+    bc = np.empty(n)
+    bc[0] = 2.0
+    for it in range(1, n):
+        mc = (2.0 if it == n - 1 else 1.0) / bc[it - 1]
+        bc[it] = (7.0 if it == n - 1 else 4.0) - mc
+        for k in range(d):
+            A[it, k] -= mc * A[it - 1, k]
 
-    return xc
+    # back substitution in place, c = 1
+    for k in range(d):
+        A[n - 1, k] /= bc[n - 1]
+    for il in range(n - 2, -1, -1):
+        for k in range(d):
+            A[il, k] = (A[il, k] - A[il + 1, k]) / bc[il]
+    return A
 
 
-def get_bezier_coef(points):
-    n = len(points) - 1
-
-    # build coefficents matrix
-    a = np.ones((n - 1))
-    a[-1] = 2
-    b = np.ones((n)) * 4
-    b[0] = 2
-    b[-1] = 7
-    c = np.ones((n - 1))
-
-    # build points vector
-    Px = [2 * (2 * points[i][0] + points[i + 1][0]) for i in range(n)]
-    Px[0] = points[0][0] + 2 * points[1][0]
-    Px[n - 1] = 8 * points[n - 1][0] + points[n][0]
-    Px = np.array(Px)
-    Py = [2 * (2 * points[i][1] + points[i + 1][1]) for i in range(n)]
-    Py[0] = points[0][1] + 2 * points[1][1]
-    Py[n - 1] = 8 * points[n - 1][1] + points[n][1]
-    Py = np.array(Py)
-
-    # solve system, find a & b
-    Ax = TDMAsolver(a, b, c, Px)
-    Ay = TDMAsolver(a, b, c, Py)
-    A = np.stack([Ax, Ay], axis=-1)
-    B = [0] * n
+@jit(
+    UniTuple(float64[:, :], 2)(float64[:, :]),
+    nopython=True,
+    nogil=True,
+)
+def build_bezier_coef(points):
+    """Control points A, B of every column of the (n + 1, d) `points`"""
+    A = solve_bezier_a(points)
+    n, d = A.shape
+    B = np.empty((n, d))
     for i in range(n - 1):
-        B[i] = 2 * points[i + 1] - A[i + 1]
-    B[n - 1] = (A[n - 1] + points[n]) / 2
-    B = np.array(B)
-
+        for k in range(d):
+            B[i, k] = 2 * points[i + 1, k] - A[i + 1, k]
+    for k in range(d):
+        B[n - 1, k] = (A[n - 1, k] + points[n, k]) / 2
     return A, B
 
 
+def get_bezier_coef(points):
+    return build_bezier_coef(np.ascontiguousarray(points, dtype=np.float64))
+
+
 def get_cubic(a, b, c, d):
     return (
         lambda t: np.power(1 - t, 3) * a
@@ -84,9 +91,88 @@ def get_bezier_cubic(points):
     ]
 
 
+class BezierSpline:
+    """
+    Piecewise cubic Bezier through `points`, evaluated in batch in Bernstein
+    form. The spline keeps the (n + 1, d) points and the (n, d) control points
+    A, B that build_bezier_coef solves for instead of per-segment power-basis
+    coefficients for Horner's rule: fitting then allocates half as much and
+    evaluates as fast, the Bernstein weights being shared by all channels.
+    Segments are located by the first coordinate of `points` (the knots).
+    `BezierSpline.fit` skips the knot coordinate and fits value channels only.
+    """
+
+    def __init__(self, points):
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        self.knots = np.ascontiguousarray(points[:, 0])
+        self.points = points
+        self.A, self.B = build_bezier_coef(points)
+
+    @classmethod
+    def fit(cls, knots, values):
+        """
+        Time-parameterized spline of the (n + 1, k) `values` channels over the
+        (n + 1,) `knots`. Only the values are fitted, so the dims of `evaluate`
+        are the k channels and `__call__` takes absolute knot coordinates.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        values = np.ascontiguousarray(values)
+        return cls.from_control(knots, values, *build_bezier_coef(values))
+
+    @classmethod
+    def from_control(cls, knots, points, A, B):
+        """Rebuilds a spline from stored points and control points A, B"""
+        spline = cls.__new__(cls)
+        spline.knots = np.ascontiguousarray(knots, dtype=np.float64)
+        spline.points = np.ascontiguousarray(points, dtype=np.float64)
+        spline.A = np.ascontiguousarray(A, dtype=np.float64)
+        spline.B = np.ascontiguousarray(B, dtype=np.float64)
+        return spline
+
+    def __len__(self):
+        return len(self.A)
+
+    def locate(self, x):
+        """Segment index, local t and in-range mask for each query `x`"""
+        x = np.asarray(x, dtype=np.float64)
+        idx = np.searchsorted(self.knots, x, side="right")
+        valid = (idx > 0) & (idx < len(self.knots))
+        seg = np.clip(idx - 1, 0, len(self.knots) - 2)
+        t = (x - self.knots[seg]) / (self.knots[seg + 1] - self.knots[seg])
+        return seg, t, valid
+
+    def evaluate(self, seg, t, dims=None):
+        """Evaluates segments `seg` at local `t`, returns (len(t), len(dims))"""
+        dims = range(self.points.shape[1]) if dims is None else dims
+        s = 1 - t
+        w0, w1, w2, w3 = s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t
+        out = np.empty((len(t), len(dims)))
+        for col, dim in enumerate(dims):
+            out[:, col] = (
+                w0 * self.points[seg, dim]
+                + w1 * self.A[seg, dim]
+                + w2 * self.B[seg, dim]
+                + w3 * self.points[seg + 1, dim]
+            )
+        return out
+
+    def __call__(self, x, dims=None):
+        """Evaluates at knot-coordinate `x`, NaN outside of the knot range"""
+        seg, t, valid = self.locate(x)
+        out = self.evaluate(seg, t, dims)
+        out[~valid] = np.nan
+        return out
+
+    def sample(self, n):
+        """`n` evenly spaced samples of local t in every segment"""
+        t = np.linspace(0, 1, n)
+        return self.evaluate(np.repeat(np.arange(len(self)), n), np.tile(t, len(self)))
+
+
 def evaluate_bezier(points, n):
-    curves = get_bezier_cubic(points)
-    return np.array([fun(t) for fun in curves for t in np.linspace(0, 1, n)])
+    return BezierSpline(points).sample(n)
 
 
 def random_plot():
@@ -106,35 +192,56 @@ def random_plot():
     plt.show()
 
 
-def plot_aria(alignment: Path):
-    def interpolate_gt(gt_data):
-        gt_timestamps = np.array([float(row["#timestamp"]) for row in gt_data])
-        gt_points_x = np.stack(
-            [
-                gt_timestamps,
-                np.array([float(row["p_RS_R_x [m]"]) for row in gt_data]),
-            ],
-            axis=-1,
-        )
-        gt_points_y = np.stack(
-            [
-                gt_timestamps,
-                np.array([float(row["p_RS_R_y [m]"]) for row in gt_data]),
-            ],
-            axis=-1,
+def benchmark(n_points=10000, n_queries=1000000):
+    points = np.cumsum(np.random.rand(n_points, 2), axis=0)
+    queries = np.random.uniform(points[0, 0], points[-1, 0], n_queries)
+    spline = BezierSpline(points)
+    spline(queries[:10])
+    t0 = time.time()
+    curves = get_bezier_cubic(points)
+    t1 = time.time()
+    spline = BezierSpline(points)
+    t2 = time.time()
+    print("fit closures {:.4f}s, spline {:.4f}s".format(t1 - t0, t2 - t1))
+
+    n_closure = min(n_queries, 100000)
+    t0 = time.time()
+    idx = np.searchsorted(points[:, 0], queries[:n_closure], side="right")
+    t = (queries[:n_closure] - points[idx - 1, 0]) / (
+        points[idx, 0] - points[idx - 1, 0]
+    )
+    closure_path = np.array([curves[i - 1](ti)[1] for i, ti in zip(idx, t)])
+    t1 = time.time()
+    spline_path = spline(queries, dims=[1])[:, 0]
+    t2 = time.time()
+    assert np.allclose(closure_path, spline_path[:n_closure])
+    closure_rate = n_closure / (t1 - t0)
+    spline_rate = n_queries / (t2 - t1)
+    print(
+        "evaluate closures {:.0f} rows/s, spline {:.0f} rows/s ({:.0f}x)".format(
+            closure_rate, spline_rate, spline_rate / closure_rate
         )
-        gt_points_z = np.stack(
-            [
-                gt_timestamps,
-                np.array([float(row["p_RS_R_z [m]"]) for row in gt_data]),
-            ],
-            axis=-1,
+    )
+
+
+def benchmark_fit(n_rows=5000000, n_columns=6):
+    """Fits `n_columns` IMU-like channels over one timestamp column"""
+    timestamps = np.cumsum(np.random.uniform(0.9e6, 1.1e6, n_rows))
+    values = np.random.randn(n_rows, n_columns)
+    BezierSpline.fit(timestamps[:10], values[:10])
+    t0 = time.time()
+    solve_bezier_a(values)
+    t1 = time.time()
+    BezierSpline.fit(timestamps, values)
+    t2 = time.time()
+    print(
+        "{} rows x {} channels: solve {:.3f}s, fit {:.3f}s".format(
+            n_rows, n_columns, t1 - t0, t2 - t1
         )
-        curves_x = get_bezier_cubic(gt_points_x)
-        curves_y = get_bezier_cubic(gt_points_y)
-        curves_z = get_bezier_cubic(gt_points_z)
-        return curves_x, curves_y, curves_z, gt_timestamps
+    )
+
 
+def plot_aria(alignment: Path):
     with open(alignment, "r") as alignment_file:
         alignment_reader = csv.DictReader(alignment_file, skipinitialspace=True)
         for truth_idx, match in enumerate(alignment_reader):
@@ -155,44 +262,13 @@ def plot_aria(alignment: Path):
             db_to_aria_time = (
                 lambda time: (time - offset + db_offset - aria_offset) / scale
             )
-            imu_data, gt_data = [], []
-            with open(alignment.parent / (db_file + "_imu.csv"), "r") as imu_csv, open(
-                alignment.parent / (aria_file + ".euroc"), "r"
-            ) as gt_csv:
-                imu_reader = csv.DictReader(imu_csv, skipinitialspace=True)
-                imu_data.extend([row for row in imu_reader])
-                gt_reader = csv.DictReader(gt_csv, skipinitialspace=True)
-                gt_data.extend([row for row in gt_reader])
-
-            input_data = []
-            for row in gt_data:
-                input_data.append(
-                    [
-                        float(row["p_RS_R_x [m]"]),
-                        float(row["p_RS_R_y [m]"]),
-                        float(row["p_RS_R_z [m]"]),
-                    ]
-                )
-            curves_x, curves_y, curves_z, gt_timestamps = interpolate_gt(gt_data)
-            output_data = []
-            for data in imu_data:
-                imu_timestamp = db_to_aria_time(float(data["timestamp"]))
-                idx = np.searchsorted(gt_timestamps, imu_timestamp, side="right")
-                if idx > 0 and idx < len(gt_timestamps):
-                    t = (imu_timestamp - gt_timestamps[idx - 1]) / (
-                        gt_timestamps[idx] - gt_timestamps[idx - 1]
-                    )
-                    assert t >= 0 and t <= 1
-                    output_data.append(
-                        [
-                            curves_x[idx - 1](t)[1],
-                            curves_y[idx - 1](t)[1],
-                            curves_z[idx - 1](t)[1],
-                        ]
-                    )
-
-            input_data = np.array(input_data)
-            output_data = np.array(output_data)
+            imu_timestamps, _ = load_phone_imu(alignment.parent / db_file, [])
+            gt_timestamps, input_data, _ = load_euroc(
+                alignment.parent / (aria_file + ".euroc")
+            )
+            spline = BezierSpline.fit(gt_timestamps, input_data)
+            output_data = spline(db_to_aria_time(imu_timestamps))
+
             plt.figure(figsize=(11, 8))
             plt.plot(input_data[:, 0], input_data[:, 1], label="10Hz")
             plt.plot(output_data[:, 0], output_data[:, 1], label="100Hz")
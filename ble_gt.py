@@ -1,178 +1,125 @@
-import csv
-import json
-import sys
+import argparse
+import logging
 from pathlib import Path
-from typing import Optional
 
 import numpy as np
 from scipy.spatial.transform import Rotation
 
-from bezier import get_bezier_cubic
-
-aria_calib_file = Path("./1WM093700U1171_473758244165429.json").resolve()
-
-
-def load_calib(calib_file=aria_calib_file):
-    calibration_info = json.load(open(calib_file, "r"))
-    assert (
-        calibration_info["OriginSpecification"]["ChildLabel"] == "camera-slam-left"
-    ), calibration_info["OriginSpecification"]["ChildLabel"]
-    rgb = calibration_info["CameraCalibrations"][
-        [
-            i
-            for i, _ in enumerate(calibration_info["CameraCalibrations"])
-            if _["Label"] == "camera-rgb"
-        ][0]
-    ]
-    assert rgb["Calibrated"] == True, rgb
-    trans = rgb["T_Device_Camera"]["Translation"]
-    rot = rgb["T_Device_Camera"]["UnitQuaternion"]
-    rot = Rotation.from_quat([*rot[1], rot[0]])
-    return rot, np.array(trans)
-
-
-def to_rig(positions, orientations: Rotation):
-    init_orient = orientations[0]
-    init_trans = positions[0]
-    positions -= init_trans
-    positions = init_orient.apply(positions, inverse=True)
-    orientations = init_orient.inv() * orientations
-    return positions, orientations
-
-
-def to_rgb(positions, orientations: Rotation, R: Rotation, T):
-    positions -= T
-    positions = R.apply(positions, inverse=True)
-    orientations = R.inv() * orientations
-    R_ref_rgb = Rotation.from_euler("y", 90, degrees=True)
-    positions = R_ref_rgb.apply(positions)
-    orientations = R_ref_rgb * orientations
-    return positions, orientations
-
-
-def get_timestamps(gt_data):
-    return np.array([float(row["#timestamp"]) for row in gt_data])
-
+import clock
+import metrics
+from gt import load_calib, load_gt
+from loaders import load_phone_ble, read_alignment
+from writers import binary_formats, write_ble_table
+
+
+def group_scans(readings: np.ndarray, max_gap=1.2, step=1.0):
+    """
+    Groups (timestamp, major, minor, rssi) readings into scans of equal
+    timestamp. Gaps longer than `max_gap` seconds are filled with empty scans
+    every `step` seconds. Returns the scan timestamps, offsets of each scan
+    into the minor/rssi arrays, minor, rssi and the number of empty scans
+    inserted after each timestamp.
+    """
+    if np.any(np.diff(readings[:, 0]) < 0):
+        readings = readings[np.argsort(readings[:, 0], kind="stable")]
+    starts = np.flatnonzero(np.diff(readings[:, 0], prepend=np.nan) != 0)
+    times = readings[starts, 0]
+    counts = np.diff(np.append(starts, len(readings)))
+    missing = np.zeros(len(times), dtype=np.int64)
+    missing[:-1] = np.ceil(np.maximum(np.diff(times) - max_gap, 0) / step)
+
+    group = np.repeat(np.arange(len(times)), missing + 1)
+    first = np.cumsum(missing + 1) - (missing + 1)
+    within = np.arange(len(group)) - first[group]
+    scan_times = times[group] + step * within
+    scan_counts = np.where(within == 0, counts[group], 0)
+    offsets = np.concatenate([[0], np.cumsum(scan_counts)])
+    minor = readings[:, 2].astype(np.int64)
+    rssi = readings[:, 3].astype(np.int64)
+    return scan_times, offsets, minor, rssi, missing
+
+
+def process_match(
+    alignment: Path,
+    truth_idx: int,
+    match,
+    R: Rotation,
+    T,
+    output_format="vvk",
+    clock_segments=0,
+):
+    db_file, aria_file = match["db_file"], match["aria_file"]
+    with metrics.step("ble_clock"):
+        db_to_aria_time = clock.db_to_aria_time(match, alignment.parent, clock_segments)
+    with metrics.step("load_phone_ble") as step:
+        ble_readings = load_phone_ble(alignment.parent / db_file)
+        step.rows = len(ble_readings)
+        db = alignment.parent / db_file
+        step.read(db if db.exists() else Path(str(db) + "_ble.csv"))
+    _, _, spline_pos = load_gt(alignment.parent / (aria_file + ".euroc"), R, T)
+
+    with metrics.step("group_scans") as step:
+        scan_times, offsets, minor, rssi, missing = group_scans(ble_readings)
+        step.rows = len(ble_readings)
+    if missing.sum() > 0:
+        logging.info(
+            f"No Beacons read for {missing.sum()} scans in "
+            f"{np.count_nonzero(missing)} gaps (longest {missing.max()})"
+        )
 
-def get_positions(gt_data):
-    return np.array(
-        [
-            [
-                float(row["p_RS_R_x [m]"]),
-                float(row["p_RS_R_y [m]"]),
-                float(row["p_RS_R_z [m]"]),
-            ]
-            for row in gt_data
-        ]
+    with metrics.step("ble_locate") as step:
+        ble_timestamps = db_to_aria_time(scan_times)
+        seg, t, valid = spline_pos.locate(ble_timestamps)
+        assert np.count_nonzero(valid) > 0
+        step.rows = len(scan_times)
+    with metrics.step("ble_evaluate") as step:
+        positions = spline_pos.evaluate(seg[valid], t[valid])
+        counts = np.diff(offsets)[valid]
+        readings = np.repeat(valid, np.diff(offsets))
+        step.rows = len(positions)
+
+    outfilename = alignment.parent / (
+        f"traj_{truth_idx}.{output_format}"
+        if output_format in ("vvk", "vvb")
+        else f"traj_{truth_idx}_ble.{output_format}"
     )
-
-
-def get_orientations(gt_data):
-    return Rotation.from_quat(
-        np.array(
-            [
-                [
-                    float(row["q_RS_x []"]),
-                    float(row["q_RS_y []"]),
-                    float(row["q_RS_z []"]),
-                    float(row["q_RS_w []"]),
-                ]
-                for row in gt_data
-            ]
+    logging.info(f"Writing {len(positions)} rows to {outfilename}")
+    with metrics.step("ble_write") as step:
+        write_ble_table(
+            outfilename,
+            ble_timestamps[valid],
+            positions,
+            np.concatenate([[0], np.cumsum(counts)]),
+            minor[readings],
+            rssi[readings],
         )
-    )
-
-
-def interpolate_gt(timestamps, points):
-    curves_x = get_bezier_cubic(np.stack([timestamps, points[:, 0]], axis=-1))
-    curves_y = get_bezier_cubic(np.stack([timestamps, points[:, 1]], axis=-1))
-    curves_z = get_bezier_cubic(np.stack([timestamps, points[:, 2]], axis=-1))
-    return curves_x, curves_y, curves_z
-
+        step.rows = len(positions)
+        step.wrote(outfilename)
 
-def process(alignment: Path, R: Rotation, T):
-    with open(alignment, "r") as alignment_file:
-        alignment_reader = csv.DictReader(alignment_file, skipinitialspace=True)
-        for truth_idx, match in enumerate(alignment_reader):
-            db_file, aria_file, scale, offset, db_offset, aria_offset = (
-                match[key]
-                for key in [
-                    "db_file",
-                    "aria_file",
-                    "scale",
-                    "offset",
-                    "db_offset",
-                    "aria_offset",
-                ]
-            )
-            scale, offset, db_offset, aria_offset = tuple(
-                map(float, [scale, offset, db_offset, aria_offset])
-            )
-            db_to_aria_time = (
-                lambda time: (time - offset + db_offset - aria_offset) / scale
-            )
-            ble_data_ungrouped, gt_data = [], []
-            with open(alignment.parent / (db_file + "_ble.csv"), "r") as ble_csv, open(
-                alignment.parent / (aria_file + ".euroc"), "r"
-            ) as gt_csv:
-                ble_reader = csv.DictReader(ble_csv, skipinitialspace=True)
-                ble_data_ungrouped.extend([row for row in ble_reader])
-                gt_reader = csv.DictReader(gt_csv, skipinitialspace=True)
-                gt_data.extend([row for row in gt_reader])
 
-            ble_data = []
-            ble_t: Optional[str] = None
-            cur_t_bles = []
-            for data in ble_data_ungrouped:
-                if ble_t != data["timestamp"]:
-                    if ble_t is not None:
-                        while float(data["timestamp"]) - float(ble_t) > 1.2:
-                            print("No Beacons read for timestamp:", ble_t)
-                            ble_data.append({"timestamp": ble_t, "ble": []})
-                            ble_t = str(float(ble_t) + 1)
-                        ble_data.append({"timestamp": ble_t, "ble": cur_t_bles})
-                    ble_t = data["timestamp"]
-                    cur_t_bles = []
-                else:
-                    cur_t_bles.append(
-                        {
-                            "major": int(data["major"]),
-                            "minor": int(data["minor"]),
-                            "rssi": int(data["rssi"]),
-                        }
-                    )
-
-            gt_timestamps = get_timestamps(gt_data)
-            gt_points = get_positions(gt_data)
-            gt_orientations = get_orientations(gt_data)
-            gt_points, gt_orientations = to_rig(gt_points, gt_orientations)
-            gt_points, gt_orientations = to_rgb(gt_points, gt_orientations, R, T)
-            curves_x, curves_y, curves_z = interpolate_gt(gt_timestamps, gt_points)
-            output_data = []
-            for data in ble_data:
-                ble_timestamp = db_to_aria_time(float(data["timestamp"]))
-                idx = np.searchsorted(gt_timestamps, ble_timestamp, side="right")
-                if idx > 0 and idx < len(gt_timestamps):
-                    t = (ble_timestamp - gt_timestamps[idx - 1]) / (
-                        gt_timestamps[idx] - gt_timestamps[idx - 1]
-                    )
-                    assert t >= 0 and t <= 1
-                    beacon_str = ";".join(
-                        [f"{b['minor']},{b['rssi']}" for b in data["ble"]]
-                    )
-                    output_data.append(
-                        f"{ble_timestamp}:{curves_x[idx - 1](t)[1]},{curves_y[idx - 1](t)[1]},{curves_z[idx - 1](t)[1]}:{beacon_str}"
-                    )
-
-            assert len(output_data) > 0
-            outfilename = alignment.parent / f"traj_{truth_idx}.vvk"
-            print("Writing", len(output_data), "rows to", outfilename)
-            with open(alignment.parent / outfilename, "w+") as outfile:
-                for row in output_data:
-                    outfile.write(f"{row}\n")
+def process(alignment: Path, R: Rotation, T, output_format="vvk", clock_segments=0):
+    for truth_idx, match in enumerate(read_alignment(alignment)):
+        process_match(alignment, truth_idx, match, R, T, output_format, clock_segments)
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s",
+        level=logging.INFO,
+        datefmt="%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser()
+    parser.add_argument("alignments", nargs="+")
+    parser.add_argument(
+        "--format", default="vvk", choices=["vvk", "vvb", *binary_formats]
+    )
+    parser.add_argument(
+        "--clock-segments",
+        type=int,
+        default=0,
+        help="refit a piecewise-linear clock from _Time_1.csv (0: alignment.csv)",
+    )
+    args = parser.parse_args()
     R, T = load_calib()
-    for alignment in sys.argv[1:]:
-        process(Path(alignment).resolve(), R, T)
+    for alignment in args.alignments:
+        process(Path(alignment).resolve(), R, T, args.format, args.clock_segments)
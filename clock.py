@@ -0,0 +1,164 @@
+import sys
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+
+class ClockModel:
+    """
+    Continuous piecewise-linear map from Aria monotonic to real time (both ns),
+    fitted over a whole _Time_1.csv stream. Knots are stored relative to the
+    first sample so that float64 keeps ns resolution.
+    """
+
+    def __init__(self, mono0: int, real0: int, knots_mono, knots_real, stats):
+        self.mono0 = mono0
+        self.real0 = real0
+        self.knots_mono = knots_mono
+        self.knots_real = knots_real
+        self.slopes = np.diff(knots_real) / np.diff(knots_mono)
+        self.stats = stats
+
+    @property
+    def scale(self) -> float:
+        """Overall real seconds per monotonic ns, as in alignment.csv"""
+        return float(
+            (self.knots_real[-1] - self.knots_real[0])
+            / (self.knots_mono[-1] - self.knots_mono[0])
+            / 1e9
+        )
+
+    @property
+    def offset(self) -> float:
+        """Real time (seconds) at monotonic 0 of the overall linear map"""
+        intercept = self.knots_real[0] - self.scale * 1e9 * self.knots_mono[0]
+        return float(
+            self.real0 / 1e9 + (intercept - self.scale * 1e9 * self.mono0) / 1e9
+        )
+
+    def to_real(self, mono):
+        """Real time (seconds) of monotonic timestamps (ns)"""
+        x = np.asarray(mono, dtype=np.float64) - self.mono0
+        seg = np.clip(np.searchsorted(self.knots_mono, x) - 1, 0, len(self.slopes) - 1)
+        y = self.knots_real[seg] + (x - self.knots_mono[seg]) * self.slopes[seg]
+        return self.real0 / 1e9 + y / 1e9
+
+    def to_mono(self, real):
+        """Monotonic timestamps (ns) of real times (seconds)"""
+        y = (np.asarray(real, dtype=np.float64) - self.real0 / 1e9) * 1e9
+        seg = np.clip(np.searchsorted(self.knots_real, y) - 1, 0, len(self.slopes) - 1)
+        return (
+            self.mono0
+            + self.knots_mono[seg]
+            + (y - self.knots_real[seg]) / (self.slopes[seg])
+        )
+
+
+def fit_knots(x, y, knots):
+    """
+    Least-squares continuous piecewise-linear fit of y(x) at `knots`. Raises
+    ValueError if a segment between two knots holds no samples.
+    """
+    n = len(knots)
+    seg = np.clip(np.searchsorted(knots, x, side="right") - 1, 0, n - 2)
+    empty = np.flatnonzero(np.bincount(seg, minlength=n - 1) == 0)
+    if len(empty) > 0:
+        raise ValueError(
+            f"Clock segments {empty.tolist()} of {n - 1} have no time sync samples,"
+            " use fewer --clock-segments"
+        )
+    w = (x - knots[seg]) / (knots[seg + 1] - knots[seg])
+    diag = np.bincount(seg, (1 - w) ** 2, n) + np.bincount(seg + 1, w**2, n)
+    off = np.bincount(seg, (1 - w) * w, n - 1)
+    AtA = np.diag(diag) + np.diag(off, 1) + np.diag(off, -1)
+    Aty = np.bincount(seg, (1 - w) * y, n) + np.bincount(seg + 1, w * y, n)
+    try:
+        return np.linalg.solve(AtA, Aty)
+    except np.linalg.LinAlgError:
+        # A segment whose samples all sit on one knot leaves AtA singular
+        return np.linalg.lstsq(AtA, Aty, rcond=None)[0]
+
+
+def fit_clock(
+    mono, real, segments=1, threshold=5.0, iterations=10, min_sigma=1000.0
+) -> ClockModel:
+    """
+    Robust fit of real = f(mono) with `segments` linear pieces (at most one
+    per pair of samples). Samples further than `threshold` robust sigmas
+    (1.4826 MAD, at least `min_sigma` ns) from the fit are rejected and the fit
+    repeated until the inliers settle, or until rejecting more would leave a
+    segment without samples.
+    """
+    mono = np.asarray(mono, dtype=np.int64)
+    real = np.asarray(real, dtype=np.int64)
+    if len(mono) < 2 or mono.min() == mono.max():
+        raise ValueError("Need at least two time sync samples at distinct times")
+    mono0, real0 = int(mono[0]), int(real[0])
+    x = (mono - mono0).astype(np.float64)
+    y = (real - real0).astype(np.float64)
+    segments = max(1, min(segments, len(x) - 1))
+    knots = np.linspace(x.min(), x.max(), segments + 1)
+
+    inliers = np.ones(len(x), dtype=bool)
+    knots_real = fit_knots(x, y, knots)
+    for _ in range(iterations):
+        residuals = y - np.interp(x, knots, knots_real)
+        sigma = max(1.4826 * np.median(np.abs(residuals[inliers])), min_sigma)
+        new_inliers = np.abs(residuals) <= threshold * sigma
+        if np.array_equal(new_inliers, inliers) or new_inliers.sum() < 2:
+            break
+        try:
+            knots_real = fit_knots(x[new_inliers], y[new_inliers], knots)
+        except ValueError:
+            break
+        inliers = new_inliers
+    residuals = y - np.interp(x, knots, knots_real)
+
+    slope = (knots_real[-1] - knots_real[0]) / (knots[-1] - knots[0])
+    stats = {
+        "samples": int(len(x)),
+        "outliers": int((~inliers).sum()),
+        "drift_ppm": float((slope - 1) * 1e6),
+        "residual_rms_ns": float(np.sqrt(np.mean(residuals[inliers] ** 2))),
+        "residual_max_ns": float(np.abs(residuals[inliers]).max()),
+    }
+    return ClockModel(mono0, real0, knots, knots_real, stats)
+
+
+def load_clock(time_file: Path, segments=1, **kwargs) -> ClockModel:
+    """Fits a ClockModel over every row of an Aria _Time_1.csv"""
+    with open(time_file, "r") as f:
+        header = [column.strip() for column in f.readline().split(",")]
+        data = np.loadtxt(
+            f,
+            delimiter=",",
+            usecols=[header.index("timestamp"), header.index("realtime")],
+            dtype=np.int64,
+            ndmin=2,
+        )
+    return fit_clock(data[:, 0], data[:, 1], segments, **kwargs)
+
+
+def db_to_aria_time(match: Dict[str, str], directory: Path, segments=0):
+    """
+    Maps phone real time (s) to Aria monotonic time (ns) for an alignment.csv
+    row. With `segments` > 0 the clock is refitted from the _Time_1.csv rather
+    than taken from the row's linear scale/offset.
+    """
+    scale, offset, db_offset, aria_offset = (
+        float(match[key]) for key in ["scale", "offset", "db_offset", "aria_offset"]
+    )
+    if segments <= 0:
+        return lambda time: (time - offset + db_offset - aria_offset) / scale
+    clock = load_clock(directory / (match["aria_file"] + "_Time_1.csv"), segments)
+    return lambda time: clock.to_mono(time + db_offset - aria_offset)
+
+
+def describe(clock: ClockModel) -> Dict[str, float]:
+    return {"scale": clock.scale, "offset": clock.offset, **clock.stats}
+
+
+if __name__ == "__main__":
+    for time_file in sys.argv[1:]:
+        print(time_file, describe(load_clock(Path(time_file).resolve())))
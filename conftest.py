@@ -0,0 +1 @@
+# Puts the repository root on sys.path so that tests import the scripts as modules
@@ -0,0 +1,64 @@
+import itertools
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from loaders import (
+    aria_sensor_suffixes,
+    header_name,
+    load_sidecar,
+    sidecar_file,
+    sidecar_header_file,
+)
+
+
+def to_npy(file: Path, chunk_rows=1 << 20) -> Path:
+    """
+    Writes the memory-mappable .npy sidecar of a csv: a plain (n, k) float64
+    array filled `chunk_rows` rows at a time, with the k header names in a
+    .npy.columns file beside it so that columns are read as views.
+    """
+    with open(file, "r") as f:
+        header = [header_name(column) for column in f.readline().split(",")]
+        rows = sum(1 for line in f if line.strip() != "")
+    sidecar = sidecar_file(file)
+    tmp = sidecar.with_name(sidecar.name + ".tmp")
+    data = np.lib.format.open_memmap(
+        tmp, mode="w+", dtype="<f8", shape=(rows, len(header))
+    )
+    with open(file, "r") as f:
+        f.readline()
+        start = 0
+        while start < rows:
+            chunk = np.loadtxt(
+                itertools.islice(f, chunk_rows),
+                delimiter=",",
+                dtype=np.float64,
+                ndmin=2,
+            )
+            data[start : start + len(chunk)] = chunk
+            start += len(chunk)
+    data.flush()
+    del data
+    with open(sidecar_header_file(file), "w") as f:
+        f.write("\n".join(header) + "\n")
+    os.replace(tmp, sidecar)
+    return sidecar
+
+
+def sensor_files(path: Path):
+    """Aria sensor csvs of a directory, or `path` itself"""
+    if not path.is_dir():
+        return [path]
+    return sorted(
+        file for suffix in aria_sensor_suffixes for file in path.glob("*" + suffix)
+    )
+
+
+if __name__ == "__main__":
+    for path in [Path(f).resolve() for f in sys.argv[1:]]:
+        for file in sensor_files(path):
+            if load_sidecar(file) is None:
+                print("Writing", to_npy(file))
@@ -0,0 +1,103 @@
+import sys
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+# .vvb layout: header, n_scans scan records, n_scans + 1 reading offsets and
+# n_readings reading records, all little-endian and 8-byte aligned so every
+# section can be memory-mapped in place.
+vvb_magic = b"VVB1"
+header_dtype = np.dtype(
+    [("magic", "S4"), ("version", "<u4"), ("n_scans", "<u8"), ("n_readings", "<u8")]
+)
+scan_dtype = np.dtype([("timestamp", "<f8"), ("x", "<f8"), ("y", "<f8"), ("z", "<f8")])
+offset_dtype = np.dtype("<i8")
+reading_dtype = np.dtype([("minor", "<i4"), ("rssi", "<i4")])
+
+
+def write_vvb(file: Path, timestamps, positions, offsets, minor, rssi) -> int:
+    """Writes BLE scans as a fixed-width .vvb file, returns the number of scans"""
+    scans = np.empty(len(timestamps), dtype=scan_dtype)
+    scans["timestamp"] = timestamps
+    scans["x"], scans["y"], scans["z"] = np.asarray(positions, dtype=np.float64).T
+    readings = np.empty(len(minor), dtype=reading_dtype)
+    readings["minor"] = minor
+    readings["rssi"] = rssi
+    offsets = np.asarray(offsets, dtype=offset_dtype)
+    assert len(offsets) == len(scans) + 1 and offsets[-1] == len(readings)
+    header = np.array([(vvb_magic, 1, len(scans), len(readings))], dtype=header_dtype)
+    with open(file, "wb") as outfile:
+        for section in [header, scans, offsets, readings]:
+            section.tofile(outfile)
+    return len(scans)
+
+
+def read_vvb(file: Path) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read-only memory maps of the scan records (timestamp, x, y, z), reading
+    offsets and reading records (minor, rssi) of a .vvb file. Scan i holds
+    readings[offsets[i]:offsets[i + 1]].
+    """
+    header = np.fromfile(file, dtype=header_dtype, count=1)
+    assert len(header) == 1 and header["magic"][0] == vvb_magic, f"{file} is no .vvb"
+    n_scans, n_readings = int(header["n_scans"][0]), int(header["n_readings"][0])
+    sections = []
+    offset = header_dtype.itemsize
+    for dtype, count in [
+        (scan_dtype, n_scans),
+        (offset_dtype, n_scans + 1),
+        (reading_dtype, n_readings),
+    ]:
+        if count == 0:
+            sections.append(np.empty(0, dtype=dtype))
+        else:
+            sections.append(
+                np.memmap(file, dtype=dtype, mode="r", offset=offset, shape=(count,))
+            )
+        offset += dtype.itemsize * count
+    scans, offsets, readings = sections
+    return scans, offsets, readings
+
+
+def read_vvk(file: Path):
+    """Timestamps, (n, 3) positions, offsets, minor and rssi of a .vvk file"""
+    with open(file, "r") as f:
+        lines = [line.rstrip("\n").split(":") for line in f if line.strip() != ""]
+    timestamps = np.array([line[0] for line in lines], dtype=np.float64)
+    positions = np.array(
+        [line[1].split(",") for line in lines], dtype=np.float64
+    ).reshape(-1, 3)
+    beacons = [line[2] for line in lines]
+    counts = [beacon.count(";") + 1 if beacon != "" else 0 for beacon in beacons]
+    values = ";".join(beacon for beacon in beacons if beacon != "")
+    pairs = np.array(
+        values.replace(";", ",").split(",") if values != "" else [], dtype=np.int64
+    ).reshape(-1, 2)
+    offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+    return timestamps, positions, offsets, pairs[:, 0], pairs[:, 1]
+
+
+def read_fingerprints(file: Path):
+    """Timestamps, (n, 3) positions, offsets, minor and rssi of a .vvk or .vvb"""
+    if file.suffix == ".vvk":
+        return read_vvk(file)
+    scans, offsets, readings = read_vvb(file)
+    positions = np.column_stack([scans["x"], scans["y"], scans["z"]])
+    return scans["timestamp"], positions, offsets, readings["minor"], readings["rssi"]
+
+
+def convert(file: Path) -> Path:
+    """Converts a .vvk to .vvb or a .vvb to .vvk next to `file`"""
+    from writers import write_vvk
+
+    assert file.suffix in (".vvk", ".vvb"), file
+    outfile = file.with_suffix(".vvb" if file.suffix == ".vvk" else ".vvk")
+    data = read_fingerprints(file)
+    (write_vvb if outfile.suffix == ".vvb" else write_vvk)(outfile, *data)
+    return outfile
+
+
+if __name__ == "__main__":
+    for file in [Path(f).resolve() for f in sys.argv[1:]]:
+        print("Writing", convert(file))
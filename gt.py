@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+import metrics
+from bezier import BezierSpline
+from loaders import load_euroc
+
+aria_calib_file = Path("./1WM093700U1171_473758244165429.json").resolve()
+
+# Bump whenever load_euroc, to_rig, to_rgb or BezierSpline change their results
+gt_cache_version = 3
+# Defaults to a .gt_cache directory beside each .euroc
+gt_cache_dir = os.environ.get("ARIA_GT_CACHE_DIR")
+gt_cache_max_bytes = int(os.environ.get("ARIA_GT_CACHE_MAX_BYTES", 1 << 30))
+
+
+def load_calib(calib_file=aria_calib_file):
+    calibration_info = json.load(open(calib_file, "r"))
+    assert (
+        calibration_info["OriginSpecification"]["ChildLabel"] == "camera-slam-left"
+    ), calibration_info["OriginSpecification"]["ChildLabel"]
+    rgb = calibration_info["CameraCalibrations"][
+        [
+            i
+            for i, _ in enumerate(calibration_info["CameraCalibrations"])
+            if _["Label"] == "camera-rgb"
+        ][0]
+    ]
+    assert rgb["Calibrated"] == True, rgb
+    trans = rgb["T_Device_Camera"]["Translation"]
+    rot = rgb["T_Device_Camera"]["UnitQuaternion"]
+    rot = Rotation.from_quat([*rot[1], rot[0]])
+    return rot, np.array(trans)
+
+
+def to_rig(positions, orientations: Rotation):
+    init_orient = orientations[0]
+    init_trans = positions[0]
+    positions -= init_trans
+    positions = init_orient.apply(positions, inverse=True)
+    orientations = init_orient.inv() * orientations
+    return positions, orientations
+
+
+def to_rgb(positions, orientations: Rotation, R: Rotation, T):
+    positions -= T
+    positions = R.apply(positions, inverse=True)
+    orientations = R.inv() * orientations
+    R_ref_rgb = Rotation.from_euler("y", 90, degrees=True)
+    positions = R_ref_rgb.apply(positions)
+    orientations = R_ref_rgb * orientations
+    return positions, orientations
+
+
+def fit_gt(timestamps, points) -> BezierSpline:
+    return BezierSpline.fit(timestamps, points)
+
+
+def file_hash(file: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(euroc: Path, R: Rotation, T) -> str:
+    """Hash of the .euroc content, the calibration and `gt_cache_version`"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(file_hash(euroc).encode())
+    h.update(R.as_quat().astype(np.float64).tobytes())
+    h.update(np.asarray(T, dtype=np.float64).tobytes())
+    h.update(str(gt_cache_version).encode())
+    return h.hexdigest()
+
+
+def get_cache_dir(euroc: Path, cache_dir: Optional[Path] = None) -> Path:
+    if cache_dir is not None:
+        return Path(cache_dir)
+    if gt_cache_dir is not None:
+        return Path(gt_cache_dir)
+    return euroc.parent / ".gt_cache"
+
+
+def evict_cache(cache_dir: Path, max_bytes=gt_cache_max_bytes):
+    """Deletes the least recently used entries until the cache fits `max_bytes`"""
+    # Other workers evict from the same directory, skip entries that vanish
+    entries = []
+    for entry in cache_dir.glob("*.npz"):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+    entries.sort(key=lambda item: item[0])
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in entries:
+        if total <= max_bytes:
+            break
+        total -= size
+        entry.unlink(missing_ok=True)
+
+
+def clear_cache(cache_dir: Path):
+    for entry in Path(cache_dir).glob("*.npz"):
+        entry.unlink(missing_ok=True)
+
+
+def load_gt(
+    euroc: Path,
+    R: Rotation,
+    T,
+    cache_dir: Optional[Path] = None,
+    max_bytes=gt_cache_max_bytes,
+):
+    """
+    Timestamps, orientations and x/y/z position spline of a .euroc in the RGB
+    frame. The transformed GT and spline coefficients are cached as an npz,
+    shared by imu_gt and ble_gt; hits refresh the entry for LRU eviction.
+    """
+    cache_dir = get_cache_dir(euroc, cache_dir)
+    entry = cache_dir / f"{euroc.stem}_{cache_key(euroc, R, T)}.npz"
+    if entry.exists():
+        try:
+            with metrics.step("gt_cache") as step, np.load(entry) as cached:
+                timestamps, quats, points, A, B = (
+                    cached["timestamps"],
+                    cached["quats"],
+                    cached["points"],
+                    cached["A"],
+                    cached["B"],
+                )
+                step.rows = len(timestamps)
+                step.read(entry)
+            os.utime(entry)
+            return (
+                timestamps,
+                Rotation.from_quat(quats),
+                BezierSpline.from_control(timestamps, points, A, B),
+            )
+        except (OSError, KeyError, ValueError):
+            entry.unlink(missing_ok=True)
+
+    with metrics.step("load_gt") as step:
+        timestamps, points, quats = load_euroc(euroc)
+        step.rows = len(timestamps)
+        step.read(euroc)
+    with metrics.step("transform_gt") as step:
+        points, orientations = to_rig(points, Rotation.from_quat(quats))
+        points, orientations = to_rgb(points, orientations, R, T)
+        step.rows = len(timestamps)
+    with metrics.step("fit_gt") as step:
+        spline_pos = fit_gt(timestamps, points)
+        step.rows = len(timestamps)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with metrics.step("gt_cache") as step:
+        with tempfile.NamedTemporaryFile(
+            dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            np.savez(
+                f,
+                timestamps=timestamps,
+                quats=orientations.as_quat(),
+                points=spline_pos.points,
+                A=spline_pos.A,
+                B=spline_pos.B,
+            )
+        os.replace(f.name, entry)
+        step.wrote(entry)
+    evict_cache(cache_dir, max_bytes)
+    return timestamps, orientations, spline_pos
@@ -1,8 +1,8 @@
+import argparse
 import csv
-import os
 import sys
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import matplotlib
 import numpy as np
@@ -14,6 +14,15 @@ from matplotlib.backends.backend_qt5agg import \
     NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
 
+from auto_align import alignment_columns, refine_shift
+from loaders import alignment_confidence, read_alignment
+from sessions import (
+    dir_match,
+    load_aria_accel,
+    load_phone_accel,
+    time_map_params,
+)
+
 
 class Canvas(FigCanvas):
     def __init__(self, width=5, height=4, dpi=100):
@@ -22,8 +31,160 @@ class Canvas(FigCanvas):
         super().__init__(fig)
 
 
+def minmax_level(t, y, size):
+    """Min and max sample of every `size` samples of (t, y), in sample order"""
+    pad = -len(y) % size
+    bins = np.concatenate([y, np.repeat(y[-1:], pad)]).reshape(-1, size)
+    start = np.arange(len(bins)) * size
+    idx = np.sort(
+        np.stack([start + bins.argmin(axis=1), start + bins.argmax(axis=1)], axis=1),
+        axis=1,
+    ).ravel()
+    idx = np.minimum(idx, len(y) - 1)
+    return t[idx], y[idx]
+
+
+class MinMaxPyramid:
+    """
+    Min/max decimation levels of a (t, y) series sorted by t, each `factor`
+    times coarser than the previous, so that any view can be drawn with a
+    bounded number of points without losing peaks.
+    """
+
+    def __init__(self, t, y, factor=4, min_points=1000):
+        self.levels = [(t, y)]
+        size = factor
+        while 2 * len(y) // size >= min_points:
+            self.levels.append(minmax_level(t, y, size))
+            size *= factor
+
+    def view(self, x0, x1, max_points=4000):
+        """Finest level with at most `max_points` points in [x0, x1], sliced"""
+        for t, y in self.levels:
+            lo = max(int(np.searchsorted(t, x0)) - 1, 0)
+            hi = min(int(np.searchsorted(t, x1, side="right")) + 1, len(t))
+            if hi - lo <= max_points:
+                break
+        return t[lo:hi], y[lo:hi]
+
+
+def build_pyramids(imu_data) -> List[MinMaxPyramid]:
+    """Pyramids of the x, y and z columns of (t, x, y, z) IMU data"""
+    return [MinMaxPyramid(imu_data[:, 0], imu_data[:, axis]) for axis in range(1, 4)]
+
+
+class MatchLoader(QtCore.QThread):
+    """
+    Loads the IMU data of a match and builds its plot pyramids off the Qt
+    thread, then emits the match index and the arguments of set_data.
+    """
+
+    loaded = QtCore.pyqtSignal(int, object)
+    failed = QtCore.pyqtSignal(int, str)
+
+    def __init__(self, idx: int, match: Tuple[str, str], parent=None):
+        super().__init__(parent)
+        self.idx = idx
+        self.match = match
+
+    def run(self):
+        try:
+            scale, offset = time_map_params(self.match)
+            db_imu_data = load_phone_accel(Path(self.match[0]))
+            # Checked between the loads so that cancelling never waits for both
+            if self.isInterruptionRequested():
+                return
+            aria_imu_data = load_aria_accel(
+                Path(self.match[1] + "_IMU_1.csv"), lambda x: scale * x + offset
+            )
+            if self.isInterruptionRequested():
+                return
+            pyramids = build_pyramids(db_imu_data), build_pyramids(aria_imu_data)
+        except Exception as e:
+            self.failed.emit(self.idx, repr(e))
+            return
+        if not self.isInterruptionRequested():
+            self.loaded.emit(
+                self.idx, (db_imu_data, aria_imu_data, scale, offset, pyramids)
+            )
+
+
+class OffsetControl(QtWidgets.QWidget):
+    """
+    Offset (seconds, may be negative) edited with a spin box and a jog slider.
+    The slider moves the offset by up to half the visible time span around the
+    value it was last released at, in steps of 1 / (2 * ticks) of the span but
+    never finer than the IMU sample period.
+    """
+
+    changed = QtCore.pyqtSignal(float)
+    ticks = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.center = 0.0
+        self.step = 0.1
+        self.slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.slider.setRange(-self.ticks, self.ticks)
+        self.slider.valueChanged.connect(self.slider_moved)
+        self.slider.sliderReleased.connect(self.recenter)
+        self.spin = QtWidgets.QDoubleSpinBox()
+        self.spin.setDecimals(6)
+        self.spin.setRange(-1e6, 1e6)
+        self.spin.setSuffix(" s")
+        self.spin.setKeyboardTracking(False)
+        self.spin.valueChanged.connect(self.spin_changed)
+        layout = QtWidgets.QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.slider, 1)
+        layout.addWidget(self.spin)
+        self.setLayout(layout)
+
+    def value(self) -> float:
+        return self.spin.value()
+
+    def set_value(self, value: float):
+        """Sets the offset and centers the slider on it without emitting"""
+        self.center = value
+        for widget, widget_value in [(self.slider, 0), (self.spin, value)]:
+            widget.blockSignals(True)
+            widget.setValue(widget_value)
+            widget.blockSignals(False)
+
+    def set_view(self, span: float, period: float):
+        """Scales the steps to a visible time span and IMU sample period"""
+        self.recenter()
+        self.step = max(span / (2 * self.ticks), period)
+        self.spin.setSingleStep(self.step)
+
+    def slider_moved(self, tick: int):
+        self.spin.blockSignals(True)
+        self.spin.setValue(self.center + tick * self.step)
+        self.spin.blockSignals(False)
+        self.changed.emit(self.spin.value())
+
+    def recenter(self):
+        self.set_value(self.spin.value())
+
+    def spin_changed(self, value: float):
+        self.set_value(value)
+        self.changed.emit(value)
+
+
+def print_alignment(row: Dict[str, float]):
+    print(",".join([str(row[column]) for column in alignment_columns[:-1]]))
+
+
 class AlignmentWindow(QtWidgets.QMainWindow):
-    def __init__(self, matches: List[Tuple[str, str]], *args, **kwargs):
+    def __init__(
+        self,
+        matches: List[Tuple[str, str]],
+        offsets: Optional[List[Tuple[float, float]]] = None,
+        on_aligned: Callable[[Dict[str, float]], None] = print_alignment,
+        min_confidence=0.1,
+        *args,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.canvas = Canvas()
         self.phone_axis = 1
@@ -32,36 +193,142 @@ class AlignmentWindow(QtWidgets.QMainWindow):
         self.aria_offset = 0
         self.phone_imu_data = None
         self.aria_imu_data = None
+        self.phone_pyramids = []
+        self.aria_pyramids = []
+        self.phone_line = None
+        self.aria_line = None
         self.aria_time_scale = 0.0
         self.aria_time_offset = 0.0
+        self.phone_period = 0.0
+        self.aria_period = 0.0
+        self.view_span = 0.0
+        self.data_idx = -1
+        self.loaders: Dict[int, MatchLoader] = {}
+        self.prefetched: Dict[int, tuple] = {}
+        self.failed: Dict[int, str] = {}
 
         self.create_main_panel()
         self.show()
         self.idx = 0
         self.matches = matches
-        print("db_file,aria_file,scale,offset,db_offset,aria_offset")
-        process(self, self.matches[self.idx])
+        self.offsets = offsets
+        self.on_aligned = on_aligned
+        self.min_confidence = min_confidence
+        self.load_match()
+
+    def load_match(self):
+        if self.offsets is not None:
+            self.set_offsets(*self.offsets[self.idx])
+        if self.idx in self.failed:
+            QtCore.QTimer.singleShot(0, self.skip_failed)
+        elif self.idx in self.prefetched:
+            self.set_data(*self.prefetched.pop(self.idx))
+        else:
+            self.statusBar().showMessage(
+                f"Loading match {self.idx + 1}/{len(self.matches)}"
+            )
+            self.progress.show()
+            self.start_loader(self.idx)
+        if self.idx + 1 < len(self.matches):
+            self.start_loader(self.idx + 1)
+
+    def start_loader(self, idx: int):
+        if idx in self.loaders or idx in self.prefetched or idx in self.failed:
+            return
+        loader = MatchLoader(idx, self.matches[idx], self)
+        loader.loaded.connect(self.match_loaded)
+        loader.failed.connect(self.match_failed)
+        loader.finished.connect(lambda: self.loaders.pop(idx, None))
+        loader.finished.connect(loader.deleteLater)
+        self.loaders[idx] = loader
+        loader.start()
+
+    def match_loaded(self, idx: int, data: tuple):
+        if idx == self.idx:
+            self.progress.hide()
+            self.statusBar().clearMessage()
+            self.set_data(*data)
+        elif idx > self.idx:
+            self.prefetched[idx] = data
+
+    def match_failed(self, idx: int, error: str):
+        print(f"Loading {self.matches[idx]} failed: {error}", file=sys.stderr)
+        self.failed[idx] = error
+        if idx == self.idx:
+            self.skip_failed()
+
+    def skip_failed(self):
+        """Reports that the current match failed to load and moves past it"""
+        if self.idx >= len(self.matches) or self.idx not in self.failed:
+            return
+        self.progress.hide()
+        self.statusBar().showMessage(f"Skipped match {self.idx + 1}")
+        QtWidgets.QMessageBox.warning(
+            self,
+            "Loading failed",
+            f"Could not load {self.matches[self.idx][0].split('/')[-1]} / "
+            f"{self.matches[self.idx][1].split('/')[-1]}, skipping it:\n\n"
+            f"{self.failed[self.idx]}",
+        )
+        if not self.next_match():
+            self.close()
+
+    def next_match(self) -> bool:
+        """Moves on to the next match, returns False after the last one"""
+        self.idx += 1
+        if self.idx < len(self.matches):
+            self.load_match()
+            return True
+        return False
+
+    def cancel_loaders(self):
+        for loader in list(self.loaders.values()):
+            loader.requestInterruption()
+        for loader in list(self.loaders.values()):
+            loader.wait()
+
+    def set_offsets(self, db_offset, aria_offset):
+        self.db_offset_control.set_value(db_offset)
+        self.aria_offset_control.set_value(aria_offset)
+        self.db_offset = db_offset
+        self.aria_offset = aria_offset
 
     def closeEvent(self, event):
-        global idx, matches
-        print(
-            f"{self.matches[self.idx][0].split('/')[-1]},"
-            f"{self.matches[self.idx][1].split('/')[-1]},"
-            f"{self.aria_time_scale},"
-            f"{self.aria_time_offset},"
-            f"{self.db_offset},"
-            f"{self.aria_offset}"
+        if self.idx >= len(self.matches) or self.data_idx != self.idx:
+            # Nothing on screen to keep, the remaining matches stay as they are
+            self.cancel_loaders()
+            event.accept()
+            return
+        self.on_aligned(
+            {
+                "db_file": self.matches[self.idx][0].split("/")[-1],
+                "aria_file": self.matches[self.idx][1].split("/")[-1],
+                "scale": self.aria_time_scale,
+                "offset": self.aria_time_offset,
+                "db_offset": self.db_offset,
+                "aria_offset": self.aria_offset,
+                "confidence": 1.0,
+            }
         )
-        self.idx += 1
-        if self.idx < len(matches):
-            process(self, self.matches[self.idx])
+        if self.next_match():
             event.ignore()
         else:
+            self.cancel_loaders()
             event.accept()
 
-    def set_data(self, phone_imu_data, aria_imu_data, aria_scale, aria_offset):
+    def set_data(
+        self, phone_imu_data, aria_imu_data, aria_scale, aria_offset, pyramids=None
+    ):
         self.phone_imu_data = phone_imu_data
         self.aria_imu_data = aria_imu_data
+        self.phone_pyramids, self.aria_pyramids = pyramids or (
+            build_pyramids(phone_imu_data),
+            build_pyramids(aria_imu_data),
+        )
+        self.phone_period = float(np.median(np.diff(phone_imu_data[:1000, 0])))
+        self.aria_period = float(np.median(np.diff(aria_imu_data[:1000, 0])))
+        self.view_span = 0.0
+        self.data_idx = self.idx
         self.aria_time_scale = aria_scale
         self.aria_time_offset = aria_offset
         self.draw_figure(skip_lim=True)
@@ -94,18 +361,13 @@ class AlignmentWindow(QtWidgets.QMainWindow):
         db_radiogroup.addWidget(db_accY_btn)
         db_radiogroup.addWidget(db_accZ_btn)
         db_radiogroup.addStretch(1)
-        db_offset = QtWidgets.QSlider(QtCore.Qt.Horizontal)
-        db_offset.setMinimum(0)
-        db_offset.setMaximum(100)
-        db_offset.setValue(0)
-        db_offset.setTickInterval(1)
-        db_offset.valueChanged.connect(
-            lambda: self.db_offset_changed(db_offset.value())
-        )
+        db_offset = OffsetControl()
+        db_offset.changed.connect(self.db_offset_changed)
         vbox_db.addWidget(self.db_title)
         vbox_db.addWidget(QtWidgets.QLabel("Phone"))
         vbox_db.addLayout(db_radiogroup)
         vbox_db.addWidget(db_offset)
+        self.db_offset_control = db_offset
 
         vbox_aria = QtWidgets.QVBoxLayout()
         self.aria_title = QtWidgets.QLabel()
@@ -125,18 +387,13 @@ class AlignmentWindow(QtWidgets.QMainWindow):
         aria_radiogroup.addWidget(aria_accY_btn)
         aria_radiogroup.addWidget(aria_accZ_btn)
         aria_radiogroup.addStretch(1)
-        aria_offset = QtWidgets.QSlider(QtCore.Qt.Horizontal)
-        aria_offset.setMinimum(0)
-        aria_offset.setMaximum(100)
-        aria_offset.setValue(0)
-        aria_offset.setTickInterval(1)
-        aria_offset.valueChanged.connect(
-            lambda: self.aria_offset_changed(aria_offset.value())
-        )
+        aria_offset = OffsetControl()
+        aria_offset.changed.connect(self.aria_offset_changed)
         vbox_aria.addWidget(self.aria_title)
         vbox_aria.addWidget(QtWidgets.QLabel("Aria"))
         vbox_aria.addLayout(aria_radiogroup)
         vbox_aria.addWidget(aria_offset)
+        self.aria_offset_control = aria_offset
 
         wbox_imus.addLayout(vbox_db)
         wbox_imus.addLayout(vbox_aria)
@@ -145,6 +402,16 @@ class AlignmentWindow(QtWidgets.QMainWindow):
         vbox.addWidget(self.canvas)
         vbox.addLayout(wbox_imus)
 
+        refine = QtWidgets.QPushButton("Refine in view")
+        refine.clicked.connect(self.refine)
+        vbox.addWidget(refine)
+
+        self.progress = QtWidgets.QProgressBar()
+        self.progress.setRange(0, 0)
+        self.progress.setMaximumWidth(120)
+        self.progress.hide()
+        self.statusBar().addPermanentWidget(self.progress)
+
     def db_offset_changed(self, value):
         self.db_offset = value
         self.draw_figure()
@@ -153,6 +420,33 @@ class AlignmentWindow(QtWidgets.QMainWindow):
         self.aria_offset = value
         self.draw_figure()
 
+    def refine(self):
+        """
+        Refines the phone offset by correlating the IMU data in view, keeping
+        the offsets if the result is below `min_confidence`
+        """
+        if self.data_idx != self.idx:
+            return
+        x0, x1 = self.canvas.axes.get_xlim()
+        shift, confidence = refine_shift(
+            self.phone_imu_data,
+            self.aria_imu_data,
+            self.db_offset - self.aria_offset,
+            x0 - self.db_offset,
+            x1 - self.db_offset,
+        )
+        if confidence < self.min_confidence:
+            self.statusBar().showMessage(
+                f"Refined shift {shift:.6f} s rejected, confidence {confidence:.2f}"
+                f" below {self.min_confidence:.2f}; zoom in on distinct motion"
+            )
+            return
+        self.set_offsets(shift + self.aria_offset, self.aria_offset)
+        self.statusBar().showMessage(
+            f"Refined shift {shift:.6f} s, confidence {confidence:.2f}"
+        )
+        self.draw_figure()
+
     def replot_aria(self, btn, aria_axis):
         if btn.isChecked() == True:
             self.aria_axis = aria_axis
@@ -163,115 +457,86 @@ class AlignmentWindow(QtWidgets.QMainWindow):
             self.phone_axis = phone_axis
             self.draw_figure()
 
+    def update_lines(self, *_):
+        """Puts the pyramid level matching the current x-limits into the lines"""
+        x0, x1 = self.canvas.axes.get_xlim()
+        max_points = 2 * max(self.canvas.width(), 500)
+        if x1 - x0 != self.view_span:
+            self.view_span = x1 - x0
+            self.db_offset_control.set_view(self.view_span, self.phone_period)
+            self.aria_offset_control.set_view(self.view_span, self.aria_period)
+        for line, pyramids, axis, offset in [
+            (self.phone_line, self.phone_pyramids, self.phone_axis, self.db_offset),
+            (self.aria_line, self.aria_pyramids, self.aria_axis, self.aria_offset),
+        ]:
+            t, y = pyramids[axis - 1].view(x0 - offset, x1 - offset, max_points)
+            line.set_data(t + offset, y)
+
     def draw_figure(self, skip_lim=False):
-        if self.phone_imu_data is not None and self.aria_imu_data is not None:
-            xlim = self.canvas.axes.get_xlim()
-            ylim = self.canvas.axes.get_ylim()
-            self.canvas.axes.clear()
-            self.canvas.axes.plot(
-                self.phone_imu_data[:, 0] + self.db_offset,
-                self.phone_imu_data[:, self.phone_axis],
-            )
-            self.canvas.axes.plot(
-                self.aria_imu_data[:, 0] + self.aria_offset,
-                self.aria_imu_data[:, self.aria_axis],
-            )
-            if not skip_lim:
-                self.canvas.axes.set_xlim(*xlim)
-                self.canvas.axes.set_ylim(*ylim)
-            self.canvas.draw()
-            self.db_title.setText(self.matches[self.idx][0].split("/")[-1])
-            self.aria_title.setText(self.matches[self.idx][1].split("/")[-1])
-
-
-def match(file: Path, against_files: List[Path]) -> Path:
-    """Finds the best match (based on timestamp) of the file against the list of files"""
-    start_time = float(csv.DictReader(open(file, "r")).__next__()["timestamp"])
-    against_times = [
-        float(csv.DictReader(open(aFile, "r")).__next__()["realtime"]) / 1e9
-        for aFile in against_files
-    ]
-    against_diffs = [(at - start_time) ** 2 for at in against_times]
-    print("TError:", np.min(against_diffs), file=sys.stderr)
-    return against_files[np.argmin(against_diffs)]
-
-
-def dir_match(dir: Path) -> List[Tuple[str, str]]:
-    assert os.path.isdir(dir)
-    files = os.listdir(dir)
-    db_imu_files = list(
-        map(
-            lambda vrs: Path(dir / vrs),
-            filter(lambda path: path.endswith("_imu.csv"), files),
-        )
-    )
-    vrs_time_files = list(
-        map(
-            lambda vrs: Path(dir / vrs),
-            filter(lambda path: path.endswith("_Time_1.csv"), files),
+        if self.phone_imu_data is None or self.aria_imu_data is None:
+            return
+        axes = self.canvas.axes
+        if skip_lim or self.phone_line is None:
+            axes.clear()
+            (self.phone_line,) = axes.plot([], [])
+            (self.aria_line,) = axes.plot([], [])
+            for line, pyramids, axis, offset in [
+                (self.phone_line, self.phone_pyramids, self.phone_axis, self.db_offset),
+                (self.aria_line, self.aria_pyramids, self.aria_axis, self.aria_offset),
+            ]:
+                t, y = pyramids[axis - 1].levels[-1]
+                line.set_data(t + offset, y)
+            axes.relim()
+            axes.autoscale_view()
+            axes.callbacks.connect("xlim_changed", self.update_lines)
+        self.update_lines()
+        self.canvas.draw_idle()
+        self.db_title.setText(self.matches[self.idx][0].split("/")[-1])
+        self.aria_title.setText(self.matches[self.idx][1].split("/")[-1])
+
+
+def review(alignment: Path, min_confidence: float):
+    """Re-aligns the rows of an auto-aligned alignment.csv below `min_confidence`"""
+    rows = read_alignment(alignment)
+    low = [row for row in rows if alignment_confidence(row) < min_confidence]
+    if len(low) > 0:
+        app = QtWidgets.QApplication([])
+        w = AlignmentWindow(
+            [
+                (
+                    str(alignment.parent / row["db_file"]),
+                    str(alignment.parent / row["aria_file"]),
+                )
+                for row in low
+            ],
+            [(float(row["db_offset"]), float(row["aria_offset"])) for row in low],
+            lambda aligned: low[w.idx].update(
+                {key: str(value) for key, value in aligned.items()}
+            ),
+            min_confidence,
         )
-    )
-    matches: List[Tuple[str, str]] = []
-    for imu_file in db_imu_files:
-        vrs_file = match(imu_file, vrs_time_files)
-        matches.append((str(imu_file)[:-8], str(vrs_file)[:-11]))
-    return matches
-
-
-def process(window: AlignmentWindow, match: Tuple[str, str]):
-    time_map_reader = csv.DictReader(open(match[1] + "_Time_1.csv", "r"))
-    time_map_0 = time_map_reader.__next__()
-    time_map_1 = time_map_reader.__next__()
-    time_map_scale = (float(time_map_1["realtime"]) - float(time_map_0["realtime"])) / (
-        float(time_map_1["timestamp"]) - float(time_map_0["timestamp"])
-    )
-    time_map_offset = float(time_map_0["realtime"]) - time_map_scale * float(
-        time_map_0["timestamp"]
-    )
-    peak_align(
-        window,
-        Path(match[0] + "_imu.csv"),
-        Path(match[1] + "_IMU_1.csv"),
-        time_map_scale / 1e9,
-        time_map_offset / 1e9,
-    )
-
-
-def peak_align(
-    window: AlignmentWindow,
-    db_imu: Path,
-    aria_imu: Path,
-    scale: float,
-    offset: float,
-):
-    time_map = lambda x: scale * x + offset
-    db_data = csv.DictReader(open(db_imu, "r"))
-    aria_data = csv.DictReader(open(aria_imu, "r"))
-    db_time, db_accx, db_accy, db_accz = [], [], [], []
-    for row in db_data:
-        db_time.append(float(row["timestamp"]))
-        db_accx.append(float(row["accX"]))
-        db_accy.append(float(row["accY"]))
-        db_accz.append(float(row["accZ"]))
-    db_imu_data = np.stack(list(map(np.array, (db_time, db_accx, db_accy, db_accz))), 1)
-    db_imu_data[:, 1:] *= -9.8
-
-    aria_time, aria_accx, aria_accy, aria_accz = [], [], [], []
-    for row in aria_data:
-        aria_time.append(time_map(float(row["timestamp"])))
-        aria_accx.append(float(row["accX"]))
-        aria_accy.append(float(row["accY"]))
-        aria_accz.append(float(row["accZ"]))
-    aria_imu_data = np.stack(
-        list(map(np.array, (aria_time, aria_accx, aria_accy, aria_accz))), 1
-    )
-    window.set_data(db_imu_data, aria_imu_data, scale, offset)
+        app.exec_()
+    with open(alignment, "w") as alignment_file:
+        writer = csv.DictWriter(alignment_file, fieldnames=alignment_columns)
+        writer.writeheader()
+        writer.writerows(rows)
 
 
 if __name__ == "__main__":
-    for dir in sys.argv[1:]:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dirs", nargs="*")
+    parser.add_argument(
+        "--review", help="alignment.csv from auto_align.py to review low confidence"
+    )
+    parser.add_argument("--min-confidence", type=float, default=0.1)
+    args = parser.parse_args()
+    if args.review is not None:
+        review(Path(args.review).resolve(), args.min_confidence)
+        sys.exit(0)
+    for dir in args.dirs:
         matches = dir_match(Path(dir).resolve())
         assert len(matches) > 0
         app = QtWidgets.QApplication([])
-        w = AlignmentWindow(matches)
+        print(",".join(alignment_columns[:-1]))
+        w = AlignmentWindow(matches, min_confidence=args.min_confidence)
         app.exec_()
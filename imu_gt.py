@@ -1,311 +1,376 @@
-import csv
-import json
+import argparse
 import logging
-import sys
 from pathlib import Path
 
 import numpy as np
 from scipy.spatial.transform import Rotation, Slerp
 from tqdm import tqdm
 
-from bezier import get_bezier_cubic
-
-aria_calib_file = Path("./1WM093700U1171_473758244165429.json").resolve()
-
-
-def load_calib(calib_file=aria_calib_file):
-    calibration_info = json.load(open(calib_file, "r"))
-    assert (
-        calibration_info["OriginSpecification"]["ChildLabel"] == "camera-slam-left"
-    ), calibration_info["OriginSpecification"]["ChildLabel"]
-    rgb = calibration_info["CameraCalibrations"][
+import clock
+import metrics
+from bezier import BezierSpline
+from gt import load_calib, load_gt
+from loaders import load_aria_imu, load_phone_imu, read_alignment
+from writers import binary_formats, write_table
+
+phone_columns = [
+    "orientW",
+    "orientX",
+    "orientY",
+    "orientZ",
+    "magOrientW",
+    "magOrientX",
+    "magOrientY",
+    "magOrientZ",
+    "accX",
+    "accY",
+    "accZ",
+    "gyroX",
+    "gyroY",
+    "gyroZ",
+    "magX",
+    "magY",
+    "magZ",
+]
+
+output_columns = [
+    "timestamp",
+    "iphoneAccX",
+    "iphoneAccY",
+    "iphoneAccZ",
+    "iphoneGyroX",
+    "iphoneGyroY",
+    "iphoneGyroZ",
+    "iphoneMagX",
+    "iphoneMagY",
+    "iphoneMagZ",
+    "stencilAccX",
+    "stencilAccY",
+    "stencilAccZ",
+    "stencilGyroX",
+    "stencilGyroY",
+    "stencilGyroZ",
+    "orientW",
+    "orientX",
+    "orientY",
+    "orientZ",
+    "processedPosX",
+    "processedPosY",
+    "processedPosZ",
+    "phoneGyroOrientW",
+    "phoneGyroOrientX",
+    "phoneGyroOrientY",
+    "phoneGyroOrientZ",
+    "phoneMagOrientW",
+    "phoneMagOrientX",
+    "phoneMagOrientY",
+    "phoneMagOrientZ",
+]
+output_formats = {"timestamp": "%.17g"}
+
+chunk_size = 65536
+
+
+R_rgb_phone = (
+    Rotation.from_euler("z", 90, degrees=True)
+    * Rotation.from_euler("y", 180, degrees=True)
+    * Rotation.from_euler("x", -45, degrees=True)
+)
+
+
+def quat_multiply(p, q):
+    """Hamilton products of (n, 4) or (4,) scalar-last quaternions"""
+    px, py, pz, pw = np.moveaxis(p, -1, 0)
+    qx, qy, qz, qw = np.moveaxis(q, -1, 0)
+    return np.stack(
         [
-            i
-            for i, _ in enumerate(calibration_info["CameraCalibrations"])
-            if _["Label"] == "camera-rgb"
-        ][0]
-    ]
-    assert rgb["Calibrated"] == True, rgb
-    trans = rgb["T_Device_Camera"]["Translation"]
-    rot = rgb["T_Device_Camera"]["UnitQuaternion"]
-    rot = Rotation.from_quat([*rot[1], rot[0]])
-    return rot, np.array(trans)
-
-
-def to_rig(positions, orientations: Rotation):
-    init_orient = orientations[0]
-    init_trans = positions[0]
-    positions -= init_trans
-    positions = init_orient.apply(positions, inverse=True)
-    orientations = init_orient.inv() * orientations
-    return positions, orientations
-
-
-def to_rgb(positions, orientations: Rotation, R: Rotation, T):
-    positions -= T
-    positions = R.apply(positions, inverse=True)
-    orientations = R.inv() * orientations
-    R_ref_rgb = Rotation.from_euler("y", 90, degrees=True)
-    positions = R_ref_rgb.apply(positions)
-    orientations = R_ref_rgb * orientations
-    return positions, orientations
-
-
-def to_aria_frame(orientations: Rotation, gt_orientations: Rotation, R_cam_rgb):
-    R_local_cam = gt_orientations
-
-    R_rgb_phone = (
-        Rotation.from_euler("z", 90, degrees=True)
-        * Rotation.from_euler("y", 180, degrees=True)
-        * Rotation.from_euler("x", -45, degrees=True)
+            pw * qx + px * qw + py * qz - pz * qy,
+            pw * qy - px * qz + py * qw + pz * qx,
+            pw * qz + px * qy - py * qx + pz * qw,
+            pw * qw - px * qx - py * qy - pz * qz,
+        ],
+        axis=-1,
     )
 
-    R_local_phone = R_local_cam * R_cam_rgb * R_rgb_phone
-    R_ios_phone = orientations
-    R_local_ios = R_local_phone * R_ios_phone.inv()
-    R_avg = R_local_ios.as_matrix().mean(axis=0)
-    U, _, V_t = np.linalg.svd(R_avg, full_matrices=True)
-    D_ = np.diag([1, 1, np.linalg.det(U @ V_t)])
-    R_avg = U @ D_ @ V_t
-    R_avg = Rotation.from_matrix(R_avg)
-    R_local_phone = R_avg * R_ios_phone
 
-    return R_local_phone
+class RotationMean:
+    """
+    Chordal L2 mean of rotations fed chunk by chunk as scalar-last unit
+    quaternions. The sum of rotation matrices is linear in the quaternion outer
+    products, so only their 4x4 sum is kept instead of an (n, 3, 3) stack.
+    """
 
+    def __init__(self):
+        self.outer = np.zeros((4, 4))
+        self.count = 0
 
-def get_timestamps(gt_data):
-    return np.array([float(row["#timestamp"]) for row in gt_data])
+    def add(self, quats):
+        self.outer += quats.T @ quats
+        self.count += len(quats)
 
-
-def get_positions(gt_data):
-    return np.array(
-        [
+    def matrix_sum(self):
+        """Sum of the rotation matrices added so far"""
+        (xx, xy, xz, xw), (_, yy, yz, yw), (_, _, zz, zw) = self.outer[:3]
+        n = self.count
+        return np.array(
             [
-                float(row["p_RS_R_x [m]"]),
-                float(row["p_RS_R_y [m]"]),
-                float(row["p_RS_R_z [m]"]),
+                [n - 2 * (yy + zz), 2 * (xy - zw), 2 * (xz + yw)],
+                [2 * (xy + zw), n - 2 * (xx + zz), 2 * (yz - xw)],
+                [2 * (xz - yw), 2 * (yz + xw), n - 2 * (xx + yy)],
             ]
-            for row in gt_data
+        )
+
+    def rotation(self) -> Rotation:
+        """Projection of the mean matrix onto SO(3)"""
+        assert self.count > 0, "No rotations to average"
+        U, _, V_t = np.linalg.svd(self.matrix_sum(), full_matrices=True)
+        D_ = np.diag([1, 1, np.linalg.det(U @ V_t)])
+        return Rotation.from_matrix(U @ D_ @ V_t)
+
+
+class ChunkedRotations:
+    """
+    Rotations built on demand as `function(data[idx], *args)`, so that a pass
+    over chunks only ever holds the rotations of one chunk
+    """
+
+    def __init__(self, function, data, *args):
+        self.function = function
+        self.data = data
+        self.args = args
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx) -> Rotation:
+        return self.function(self.data[idx], *self.args)
+
+
+def wxyz_rotations(data, column: int) -> Rotation:
+    """Rotations of the scalar-first quaternions in data[:, column:column + 4]"""
+    return Rotation.from_quat(data[:, [column + 1, column + 2, column + 3, column]])
+
+
+def ios_to_local_chunks(streams, gt_orientations: Rotation, R_cam_rgb, stride=1):
+    """
+    R_local_ios quaternions of every `stride`-th sample of each stream. Streams
+    and `gt_orientations` are Rotations or ChunkedRotations.
+    """
+    q_cam_phone = (R_cam_rgb * R_rgb_phone).as_quat()
+    conjugate = np.array([-1.0, -1.0, -1.0, 1.0])
+    step = chunk_size * stride
+    for start in range(0, len(gt_orientations), step):
+        idx = slice(start, start + step, stride)
+        q_local_phone = quat_multiply(gt_orientations[idx].as_quat(), q_cam_phone)
+        yield [
+            quat_multiply(q_local_phone, R_ios_phone[idx].as_quat() * conjugate)
+            for R_ios_phone in streams
         ]
-    )
 
 
-def get_orientations(gt_data):
-    return Rotation.from_quat(
-        np.array(
+def get_ios_to_local_streams(
+    streams, gt_orientations: Rotation, R_cam_rgb, stride=1, max_angle=None
+):
+    """
+    Average ios to local frame rotation of each phone orientation stream
+    (gyro, mag, ...) against the same GT orientations, in one pass over chunks.
+    `stride` subsamples the streams. With `max_angle` (radians) a second pass
+    averages only the samples within that angle of the first mean.
+    """
+    means = [RotationMean() for _ in streams]
+    for chunk in ios_to_local_chunks(streams, gt_orientations, R_cam_rgb, stride):
+        for mean, q_local_ios in zip(means, chunk):
+            mean.add(q_local_ios)
+    if max_angle is None:
+        return [mean.rotation() for mean in means]
+
+    centers = [mean.rotation().as_quat() for mean in means]
+    means = [RotationMean() for _ in streams]
+    for chunk in ios_to_local_chunks(streams, gt_orientations, R_cam_rgb, stride):
+        for mean, center, q_local_ios in zip(means, centers, chunk):
+            inliers = np.abs(q_local_ios @ center) >= np.cos(max_angle / 2)
+            mean.add(q_local_ios[inliers])
+    rotations = []
+    for mean, center in zip(means, centers):
+        if mean.count == 0:
+            logging.warning(
+                f"No samples within {np.degrees(max_angle):.1f} degrees of the mean"
+                " frame rotation, keeping the mean of all samples"
+            )
+            rotations.append(Rotation.from_quat(center))
+        else:
+            rotations.append(mean.rotation())
+    return rotations
+
+
+def interpolate_gt(timestamps, orientations: Rotation, gt_imu_timestamps, gt_imu):
+    curves_orient = Slerp(timestamps, orientations)
+    spline_imu = BezierSpline.fit(gt_imu_timestamps, gt_imu)
+
+    return curves_orient, spline_imu
+
+
+def interpolate_chunks(
+    timestamps,
+    phone_data,
+    gt_orientations: Rotation,
+    spline_pos: BezierSpline,
+    spline_gt_imu: BezierSpline,
+    R_gyro: Rotation,
+    R_mag: Rotation,
+    chunk_size=chunk_size,
+):
+    """Yields `output_columns` rows in chunks of `chunk_size`"""
+    for start in range(0, len(timestamps), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_timestamps = timestamps[chunk]
+        chunk_phone = phone_data[chunk]
+        gyro_orient = R_gyro * wxyz_rotations(chunk_phone, 0)
+        mag_orient = R_mag * wxyz_rotations(chunk_phone, 4)
+        yield np.column_stack(
             [
-                [
-                    float(row["q_RS_x []"]),
-                    float(row["q_RS_y []"]),
-                    float(row["q_RS_z []"]),
-                    float(row["q_RS_w []"]),
-                ]
-                for row in gt_data
+                chunk_timestamps,
+                chunk_phone[:, 8:],
+                spline_gt_imu(chunk_timestamps),
+                gt_orientations[chunk].as_quat()[:, [3, 0, 1, 2]],
+                spline_pos(chunk_timestamps),
+                gyro_orient.as_quat()[:, [3, 0, 1, 2]],
+                mag_orient.as_quat()[:, [3, 0, 1, 2]],
             ]
         )
+
+
+def add_frame_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--stride",
+        type=int,
+        default=1,
+        help="average the phone to Aria frame rotation over every N-th sample",
+    )
+    parser.add_argument(
+        "--max-angle",
+        type=float,
+        default=None,
+        help="re-average over samples within this many degrees of the first mean",
     )
 
 
-def get_gt_imu(gt_imu_data):
-    timestamps = np.array([float(row["timestamp"]) for row in gt_imu_data])
-    imu = np.array(
-        [
-            [
-                float(row["accX"]),
-                float(row["accY"]),
-                float(row["accZ"]),
-                float(row["gyroX"]),
-                float(row["gyroY"]),
-                float(row["gyroZ"]),
-            ]
-            for row in gt_imu_data
-        ]
+def process_match(
+    alignment: Path,
+    truth_idx: int,
+    match,
+    R: Rotation,
+    T,
+    output_format="csv",
+    clock_segments=0,
+    stride=1,
+    max_angle=None,
+):
+    """
+    Writes traj_<truth_idx> for one alignment.csv row. The phone to Aria frame
+    rotations are averaged over every `stride`-th sample, and with `max_angle`
+    (degrees) again over the samples within that angle of the first mean.
+    """
+    db_file, aria_file = match["db_file"], match["aria_file"]
+    logging.info(f"Processing {aria_file}->{db_file}")
+    logging.info("Reading data files")
+    with metrics.step("imu_clock"):
+        db_to_aria_time = clock.db_to_aria_time(match, alignment.parent, clock_segments)
+    with metrics.step("load_phone_imu") as step:
+        imu_timestamps, phone_data = load_phone_imu(
+            alignment.parent / db_file, phone_columns
+        )
+        step.rows = len(imu_timestamps)
+        db = alignment.parent / db_file
+        step.read(db if db.exists() else Path(str(db) + "_imu.csv"))
+    gt_timestamps, gt_orientations, spline_pos = load_gt(
+        alignment.parent / (aria_file + ".euroc"), R, T
     )
-    return timestamps, imu
+    with metrics.step("load_aria_imu") as step:
+        gt_imu_timestamps, gt_imu = load_aria_imu(
+            alignment.parent / (aria_file + "_IMU_1.csv")
+        )
+        step.rows = len(gt_imu_timestamps)
+        step.read(alignment.parent / (aria_file + "_IMU_1.csv"))
 
+    logging.info("Interpolating data")
+    with metrics.step("fit_imu") as step:
+        curves_orient, spline_gt_imu = interpolate_gt(
+            gt_timestamps, gt_orientations, gt_imu_timestamps, gt_imu
+        )
+        step.rows = len(gt_imu_timestamps)
+    with metrics.step("imu_locate") as step:
+        imu_timestamps = db_to_aria_time(imu_timestamps)
+        _, _, valid = spline_pos.locate(imu_timestamps)
+        _, _, valid_gt_imu = spline_gt_imu.locate(imu_timestamps)
+        valid &= valid_gt_imu
+        assert np.any(valid)
+        imu_timestamps = imu_timestamps[valid]
+
+        phone_data = phone_data[valid]
+        step.rows = len(valid)
+
+    logging.info("Rotating phone orientations to aria frame")
+    with metrics.step("align_frames") as step:
+        output_gt_orient = ChunkedRotations(curves_orient, imu_timestamps)
+        R_gyro, R_mag = get_ios_to_local_streams(
+            [
+                ChunkedRotations(wxyz_rotations, phone_data, 0),
+                ChunkedRotations(wxyz_rotations, phone_data, 4),
+            ],
+            output_gt_orient,
+            R,
+            stride,
+            None if max_angle is None else np.radians(max_angle),
+        )
+        step.rows = len(imu_timestamps)
+    chunks = interpolate_chunks(
+        imu_timestamps,
+        phone_data,
+        output_gt_orient,
+        spline_pos,
+        spline_gt_imu,
+        R_gyro,
+        R_mag,
+    )
 
-def interpolate_gt(
-    timestamps, points, orientations: Rotation, gt_imu_timestamps, gt_imu
+    outfilename = alignment.parent / f"traj_{truth_idx}.{output_format}"
+    logging.info(f"Writing {len(imu_timestamps)} rows to {outfilename}")
+    with metrics.step("imu_write") as step:
+        write_table(
+            outfilename,
+            output_columns,
+            tqdm(
+                metrics.iterate("imu_evaluate", chunks),
+                total=-(-len(imu_timestamps) // chunk_size),
+            ),
+            formats=output_formats,
+        )
+        step.rows = len(imu_timestamps)
+        step.wrote(outfilename)
+
+
+def process(
+    alignment: Path,
+    R: Rotation,
+    T,
+    output_format="csv",
+    clock_segments=0,
+    stride=1,
+    max_angle=None,
 ):
-    curves_x = get_bezier_cubic(np.stack([timestamps, points[:, 0]], axis=-1))
-    curves_y = get_bezier_cubic(np.stack([timestamps, points[:, 1]], axis=-1))
-    curves_z = get_bezier_cubic(np.stack([timestamps, points[:, 2]], axis=-1))
-    curves_orient = Slerp(timestamps, orientations)
-    curves_imu = [
-        get_bezier_cubic(np.stack([gt_imu_timestamps, gt_imu[:, i]], axis=-1))
-        for i in range(gt_imu.shape[1])
-    ]
-
-    return curves_x, curves_y, curves_z, curves_orient, curves_imu
-
-
-def process(alignment: Path, R: Rotation, T):
-    with open(alignment, "r") as alignment_file:
-        alignment_reader = csv.DictReader(
-            alignment_file, skipinitialspace=True)
-        for truth_idx, match in enumerate(alignment_reader):
-            db_file, aria_file, scale, offset, db_offset, aria_offset = (
-                match[key]
-                for key in [
-                    "db_file",
-                    "aria_file",
-                    "scale",
-                    "offset",
-                    "db_offset",
-                    "aria_offset",
-                ]
-            )
-            logging.info(f"Processing {aria_file}->{db_file}")
-            logging.info("Reading data files")
-            scale, offset, db_offset, aria_offset = tuple(
-                map(float, [scale, offset, db_offset, aria_offset])
-            )
-            db_to_aria_time = (
-                lambda time: (time - offset + db_offset - aria_offset) / scale
-            )
-            imu_data, gt_data, gt_imu_data = [], [], []
-            with open(alignment.parent / (db_file + "_imu.csv"), "r") as imu_csv, open(
-                alignment.parent / (aria_file + ".euroc"), "r"
-            ) as gt_csv, open(
-                alignment.parent / (aria_file + "_IMU_1.csv"), "r"
-            ) as gt_imu_csv:
-                imu_reader = csv.DictReader(imu_csv, skipinitialspace=True)
-                imu_data.extend([row for row in imu_reader])
-                gt_reader = csv.DictReader(gt_csv, skipinitialspace=True)
-                gt_data.extend([row for row in gt_reader])
-                gt_imu_reader = csv.DictReader(
-                    gt_imu_csv, skipinitialspace=True)
-                gt_imu_data.extend([row for row in gt_imu_reader])
-
-            logging.info("Interpolating data")
-            gt_timestamps = get_timestamps(gt_data)
-            gt_points = get_positions(gt_data)
-            gt_orientations = get_orientations(gt_data)
-            gt_imu_timestamps, gt_imu = get_gt_imu(gt_imu_data)
-            gt_points, gt_orientations = to_rig(gt_points, gt_orientations)
-            gt_points, gt_orientations = to_rgb(
-                gt_points, gt_orientations, R, T)
-            curves_x, curves_y, curves_z, curves_orient, curves_gt_imu = interpolate_gt(
-                gt_timestamps, gt_points, gt_orientations, gt_imu_timestamps, gt_imu
-            )
-            output_data = []
-            output_gt_orient = []
-            output_phone_gyro_orient = []
-            output_phone_mag_orient = []
-            for data in tqdm(imu_data):
-                imu_timestamp = db_to_aria_time(float(data["timestamp"]))
-                idx = np.searchsorted(
-                    gt_timestamps, imu_timestamp, side="right")
-                idx_gt_imu = np.searchsorted(
-                    gt_imu_timestamps, imu_timestamp, side="right"
-                )
-                if idx > 0 and idx < len(gt_timestamps):
-                    t = (imu_timestamp - gt_timestamps[idx - 1]) / (
-                        gt_timestamps[idx] - gt_timestamps[idx - 1]
-                    )
-                    t_gt_imu = (imu_timestamp - gt_imu_timestamps[idx_gt_imu - 1]) / (
-                        gt_imu_timestamps[idx_gt_imu]
-                        - gt_imu_timestamps[idx_gt_imu - 1]
-                    )
-                    assert t >= 0 and t <= 1
-                    orientation = curves_orient(imu_timestamp).as_quat()
-                    stencilAccX = curves_gt_imu[0][idx_gt_imu - 1](t_gt_imu)[1]
-                    stencilAccY = curves_gt_imu[1][idx_gt_imu - 1](t_gt_imu)[1]
-                    stencilAccZ = curves_gt_imu[2][idx_gt_imu - 1](t_gt_imu)[1]
-                    stencilGyroX = curves_gt_imu[3][idx_gt_imu - 1](t_gt_imu)[
-                        1]
-                    stencilGyroY = curves_gt_imu[4][idx_gt_imu - 1](t_gt_imu)[
-                        1]
-                    stencilGyroZ = curves_gt_imu[5][idx_gt_imu - 1](t_gt_imu)[
-                        1]
-
-                    output_gt_orient.append(Rotation.from_quat(orientation))
-                    output_phone_gyro_orient.append(
-                        Rotation.from_quat(
-                            [
-                                float(data["orientX"]),
-                                float(data["orientY"]),
-                                float(data["orientZ"]),
-                                float(data["orientW"]),
-                            ]
-                        )
-                    )
-                    output_phone_mag_orient.append(
-                        Rotation.from_quat(
-                            [
-                                float(data["magOrientX"]),
-                                float(data["magOrientY"]),
-                                float(data["magOrientZ"]),
-                                float(data["magOrientW"]),
-                            ]
-                        )
-                    )
-                    output_data.append(
-                        {
-                            "timestamp": float(imu_timestamp),
-                            "iphoneAccX": float(data["accX"]),
-                            "iphoneAccY": float(data["accY"]),
-                            "iphoneAccZ": float(data["accZ"]),
-                            "iphoneGyroX": float(data["gyroX"]),
-                            "iphoneGyroY": float(data["gyroY"]),
-                            "iphoneGyroZ": float(data["gyroZ"]),
-                            "iphoneMagX": float(data["magX"]),
-                            "iphoneMagY": float(data["magY"]),
-                            "iphoneMagZ": float(data["magZ"]),
-                            "stencilAccX": stencilAccX,
-                            "stencilAccY": stencilAccY,
-                            "stencilAccZ": stencilAccZ,
-                            "stencilGyroX": stencilGyroX,
-                            "stencilGyroY": stencilGyroY,
-                            "stencilGyroZ": stencilGyroZ,
-                            "orientW": orientation[3],
-                            "orientX": orientation[0],
-                            "orientY": orientation[1],
-                            "orientZ": orientation[2],
-                            "processedPosX": curves_x[idx - 1](t)[1],
-                            "processedPosY": curves_y[idx - 1](t)[1],
-                            "processedPosZ": curves_z[idx - 1](t)[1],
-                        }
-                    )
-
-            assert len(output_data) > 0
-
-            logging.info("Rotating phone orientations to aria frame")
-            output_gt_orient = Rotation.concatenate(output_gt_orient)
-            output_phone_gyro_orient = Rotation.concatenate(
-                output_phone_gyro_orient)
-            output_phone_mag_orient = Rotation.concatenate(
-                output_phone_mag_orient)
-            output_phone_gyro_orient = to_aria_frame(
-                output_phone_gyro_orient, output_gt_orient, R
-            ).as_quat()
-            output_phone_mag_orient = to_aria_frame(
-                output_phone_mag_orient, output_gt_orient, R
-            ).as_quat()
-
-            for idx, (d, gyro_orient, mag_orient) in enumerate(
-                zip(output_data, output_phone_gyro_orient, output_phone_mag_orient)
-            ):
-                output_data[idx] = {
-                    **d,
-                    "phoneGyroOrientW": gyro_orient[3],
-                    "phoneGyroOrientX": gyro_orient[0],
-                    "phoneGyroOrientY": gyro_orient[1],
-                    "phoneGyroOrientZ": gyro_orient[2],
-                    "phoneMagOrientW": mag_orient[3],
-                    "phoneMagOrientX": mag_orient[0],
-                    "phoneMagOrientY": mag_orient[1],
-                    "phoneMagOrientZ": mag_orient[2],
-                }
-
-            outfilename = alignment.parent / f"traj_{truth_idx}.csv"
-            logging.info(f"Writing {len(output_data)} rows to {outfilename}")
-            with open(alignment.parent / outfilename, "w+") as outfile:
-                writer = csv.DictWriter(
-                    outfile, fieldnames=list(output_data[0].keys()))
-                writer.writeheader()
-                for row in tqdm(output_data):
-                    writer.writerow(row)
+    for truth_idx, match in enumerate(read_alignment(alignment)):
+        process_match(
+            alignment,
+            truth_idx,
+            match,
+            R,
+            T,
+            output_format,
+            clock_segments,
+            stride,
+            max_angle,
+        )
 
 
 if __name__ == "__main__":
@@ -314,6 +379,25 @@ if __name__ == "__main__":
         level=logging.INFO,
         datefmt="%H:%M:%S",
     )
+    parser = argparse.ArgumentParser()
+    parser.add_argument("alignments", nargs="+")
+    parser.add_argument("--format", default="csv", choices=["csv", *binary_formats])
+    parser.add_argument(
+        "--clock-segments",
+        type=int,
+        default=0,
+        help="refit a piecewise-linear clock from _Time_1.csv (0: alignment.csv)",
+    )
+    add_frame_arguments(parser)
+    args = parser.parse_args()
     R, T = load_calib()
-    for alignment in sys.argv[1:]:
-        process(Path(alignment).resolve(), R, T)
+    for alignment in args.alignments:
+        process(
+            Path(alignment).resolve(),
+            R,
+            T,
+            args.format,
+            args.clock_segments,
+            args.stride,
+            args.max_angle,
+        )
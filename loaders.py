@@ -0,0 +1,213 @@
+import csv
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import phone_db
+
+euroc_position_columns = ["p_RS_R_x [m]", "p_RS_R_y [m]", "p_RS_R_z [m]"]
+euroc_quat_columns = ["q_RS_x []", "q_RS_y []", "q_RS_z []", "q_RS_w []"]
+aria_imu_columns = ["accX", "accY", "accZ", "gyroX", "gyroY", "gyroZ"]
+binary_suffixes = (".feather", ".parquet", ".npz")
+aria_sensor_suffixes = ["_IMU_1.csv", "_Magnet_1.csv", "_Baro_1.csv"]
+
+
+def header_name(column: str) -> str:
+    """Normalizes a csv header name, `#timestamp` becomes `timestamp`"""
+    return column.strip().lstrip("#").strip()
+
+
+def sidecar_file(file: Path) -> Path:
+    """.npy sidecar written by csv_to_npy.py next to a csv"""
+    return file.with_name(file.name + ".npy")
+
+
+def sidecar_header_file(file: Path) -> Path:
+    """Column names of the .npy sidecar of a csv, one per line"""
+    return file.with_name(file.name + ".npy.columns")
+
+
+def load_sidecar(file: Path) -> Optional[Tuple[List[str], np.ndarray]]:
+    """
+    Column names and read-only (n, k) float64 memory map of the .npy sidecar
+    of a csv, or None if it is missing, older than the csv or not 2-D.
+    """
+    sidecar = sidecar_file(file)
+    try:
+        if sidecar.stat().st_mtime < file.stat().st_mtime:
+            return None
+        with open(sidecar_header_file(file), "r") as f:
+            header = f.read().split()
+        data = np.load(sidecar, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if data.ndim != 2 or data.shape[1] != len(header):
+        return None
+    return header, data
+
+
+def column_view(data: np.ndarray, usecols: List[int]) -> np.ndarray:
+    """
+    `data[:, usecols]`, as a view of `data` when the columns are evenly spaced
+    in increasing order (the usual timestamp + sensor axes), else a copy.
+    """
+    step = usecols[1] - usecols[0] if len(usecols) > 1 else 1
+    if step > 0 and usecols == list(range(usecols[0], usecols[-1] + 1, step)):
+        view = data[:, usecols[0] : usecols[-1] + 1 : step]
+        assert np.shares_memory(view, data)
+        return view
+    return data[:, usecols]
+
+
+def read_text_columns(
+    file: Path, columns: List[str], max_rows: Optional[int] = None
+) -> np.ndarray:
+    sidecar = load_sidecar(file)
+    if sidecar is not None:
+        header, data = sidecar
+        usecols = [header.index(header_name(c)) for c in columns]
+        return column_view(data[:max_rows], usecols)
+    with open(file, "r") as f:
+        header = [header_name(column) for column in f.readline().split(",")]
+        usecols = [header.index(header_name(column)) for column in columns]
+        return np.loadtxt(
+            f,
+            delimiter=",",
+            usecols=usecols,
+            dtype=np.float64,
+            ndmin=2,
+            max_rows=max_rows,
+        )
+
+
+def read_npz_column(archive: zipfile.ZipFile, column: str, max_rows: int):
+    """First `max_rows` values of a 1-D array of an npz, without reading the rest"""
+    with archive.open(column + ".npy") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        count = min(shape[0], max_rows)
+        return np.frombuffer(f.read(count * dtype.itemsize), dtype=dtype, count=count)
+
+
+def read_binary_columns(
+    file: Path, columns: List[str], max_rows: Optional[int] = None
+) -> np.ndarray:
+    if file.suffix == ".npz":
+        if max_rows is not None:
+            with zipfile.ZipFile(file) as archive:
+                return np.column_stack(
+                    [read_npz_column(archive, column, max_rows) for column in columns]
+                )
+        with np.load(file) as data:
+            return np.column_stack([data[column] for column in columns])
+
+    if file.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        if max_rows is None:
+            table = pq.read_table(file, columns=columns)
+        else:
+            # Only the row groups holding the first `max_rows` are decoded
+            batches = pq.ParquetFile(file).iter_batches(
+                batch_size=max(max_rows, 1), columns=columns
+            )
+            batch = next(batches, None)
+            if batch is None:
+                table = pq.read_table(file, columns=columns)
+            else:
+                import pyarrow as pa
+
+                table = pa.Table.from_batches([batch])
+    else:
+        import pyarrow.feather as feather
+
+        # write_arrow's files are uncompressed, mapped pages are only read
+        # for the rows kept
+        table = feather.read_table(file, columns=columns, memory_map=True)
+    if max_rows is not None:
+        table = table.slice(0, max_rows)
+    return np.column_stack(
+        [table.column(column).to_numpy().astype(np.float64) for column in columns]
+    )
+
+
+def read_columns(
+    file: Path, columns: List[str], max_rows: Optional[int] = None
+) -> np.ndarray:
+    """
+    Reads `columns` (picked by header name) of a csv file in a single pass,
+    returns a (n_rows, len(columns)) float64 array in the requested order.
+    Binary traj outputs (.feather, .parquet, .npz) are read natively. With
+    `max_rows` only the first `max_rows` rows are read.
+    """
+    if file.suffix in binary_suffixes:
+        return read_binary_columns(file, columns, max_rows)
+    return read_text_columns(file, columns, max_rows)
+
+
+def read_header(file: Path) -> List[str]:
+    """Column names of a csv or binary traj file"""
+    if file.suffix == ".npz":
+        with np.load(file) as data:
+            return list(data.files)
+    elif file.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(file).names
+    elif file.suffix == ".feather":
+        import pyarrow.feather as feather
+
+        return feather.read_table(file).schema.names
+    with open(file, "r") as f:
+        return [header_name(column) for column in f.readline().split(",")]
+
+
+def load_euroc(file: Path):
+    """Timestamps, (n, 3) positions and (n, 4) xyzw quaternions of a .euroc file"""
+    data = read_columns(
+        file, ["timestamp", *euroc_position_columns, *euroc_quat_columns]
+    )
+    return data[:, 0], data[:, 1:4], data[:, 4:8]
+
+
+def load_aria_imu(file: Path):
+    """Timestamps and (n, 6) accel/gyro of an Aria _IMU_1.csv file"""
+    data = read_columns(file, ["timestamp", *aria_imu_columns])
+    return data[:, 0], data[:, 1:]
+
+
+def load_phone_imu(db_file: Path, columns: List[str]):
+    """
+    Timestamps and (n, len(columns)) `columns` of a phone session, queried from
+    the .db directly or read from its db.sh `_imu.csv` export if the .db is gone.
+    """
+    if db_file.exists():
+        return phone_db.read_imu(db_file, columns)
+    data = read_columns(Path(str(db_file) + "_imu.csv"), ["timestamp", *columns])
+    return data[:, 0], data[:, 1:]
+
+
+def load_phone_ble(db_file: Path) -> np.ndarray:
+    """(n, 4) timestamp, major, minor, rssi readings of a phone session"""
+    if db_file.exists():
+        return phone_db.read_ble(db_file)
+    return read_columns(Path(str(db_file) + "_ble.csv"), phone_db.ble_columns)
+
+
+def read_alignment(alignment: Path) -> List[Dict[str, str]]:
+    """Match rows (db_file, aria_file, scale, offset, ...) of an alignment.csv"""
+    with open(alignment, "r") as alignment_file:
+        return list(csv.DictReader(alignment_file, skipinitialspace=True))
+
+
+def alignment_confidence(row: Dict[str, str]) -> float:
+    """
+    Confidence of an alignment.csv row, rows without one (written before
+    auto_align or by hand) count as reviewed
+    """
+    return float(row.get("confidence") or 1.0)
@@ -0,0 +1,221 @@
+import cProfile
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# Profiles every stage/match into this directory when set (see profiled)
+profile_dir_env = "ARIA_PROFILE_DIR"
+proc_status = Path("/proc/self/status")
+# Seconds between the RSS samples taken while a step is active
+sample_interval = 0.01
+
+
+class Step:
+    """
+    Wall time, rows, bytes read/written and peak RSS of one named step.
+    `seconds` excludes the steps nested in it, so the steps of a run add up.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.child_seconds = 0.0
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss = 0
+
+    def read(self, *files: Path):
+        self.bytes_read += sum(file_size(file) for file in files)
+
+    def wrote(self, *files: Path):
+        self.bytes_written += sum(file_size(file) for file in files)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "rows": self.rows,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_mb": self.peak_rss / (1 << 20),
+        }
+
+
+_active: List[Step] = []
+_finished: List[dict] = []
+_sampler_pid: Optional[int] = None
+
+
+def file_size(file: Path) -> int:
+    try:
+        return os.stat(file).st_size
+    except OSError:
+        return 0
+
+
+def status_kb(field: str) -> int:
+    """A memory field (VmRSS, VmHWM) of /proc/self/status in bytes"""
+    with open(proc_status, "r") as f:
+        return 1024 * next(int(line.split()[1]) for line in f if line.startswith(field))
+
+
+def max_rss() -> int:
+    """Peak RSS of this process over its lifetime in bytes"""
+    try:
+        return status_kb("VmHWM")
+    except (OSError, StopIteration, ValueError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss * (1 if sys.platform == "darwin" else 1024)
+
+
+def sample_rss():
+    """
+    Folds the current RSS into the peak of the active steps. Without
+    /proc/self/status (not Linux) the steps get the process-lifetime peak.
+    """
+    try:
+        rss = status_kb("VmRSS")
+    except (OSError, StopIteration, ValueError):
+        rss = max_rss()
+    # A snapshot, the sampler thread runs while steps start and end
+    for active in list(_active):
+        active.peak_rss = max(active.peak_rss, rss)
+
+
+def sample_loop():
+    while True:
+        time.sleep(sample_interval)
+        if len(_active) > 0:
+            sample_rss()
+
+
+def start_sampler():
+    """
+    Starts the thread sampling RSS every `sample_interval` seconds while steps
+    are active, once per process (threads do not survive a fork). Sampling
+    leaves the kernel's peak RSS (VmHWM, ru_maxrss) untouched.
+    """
+    global _sampler_pid
+    if _sampler_pid != os.getpid():
+        _sampler_pid = os.getpid()
+        threading.Thread(target=sample_loop, name="sample_rss", daemon=True).start()
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process in MiB"""
+    return max_rss() / (1 << 20)
+
+
+@contextmanager
+def step(name: str):
+    """Records the block as step `name`, yielding the Step to add counts to"""
+    start_sampler()
+    current = Step(name)
+    _active.append(current)
+    sample_rss()
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        elapsed = time.perf_counter() - start
+        sample_rss()
+        _active.pop()
+        if len(_active) > 0:
+            _active[-1].child_seconds += elapsed
+        current.seconds = elapsed - current.child_seconds
+        _finished.append(current.to_dict())
+
+
+def iterate(name: str, chunks: Iterable):
+    """
+    Yields from `chunks`, recording the time spent producing them and their
+    rows as step `name`. Lets lazily evaluated chunks be told apart from the
+    writer consuming them.
+    """
+    iterator = iter(chunks)
+    while True:
+        with step(name) as current:
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            current.rows = len(chunk)
+        yield chunk
+
+
+def merge(records: Iterable[dict]) -> List[dict]:
+    """Step records summed by name, keeping the highest peak RSS"""
+    merged: Dict[str, dict] = {}
+    for record in records:
+        if record["name"] not in merged:
+            merged[record["name"]] = dict(record)
+            continue
+        total = merged[record["name"]]
+        for key in ["seconds", "rows", "bytes_read", "bytes_written"]:
+            total[key] += record[key]
+        total["peak_rss_mb"] = max(total["peak_rss_mb"], record["peak_rss_mb"])
+    return list(merged.values())
+
+
+def collect() -> List[dict]:
+    """Steps finished in this process since the last collect, merged by name"""
+    records = merge(_finished)
+    _finished.clear()
+    return records
+
+
+def profiled(name: str, function, *args):
+    """
+    Calls `function(*args)`, under cProfile if $ARIA_PROFILE_DIR is set, in
+    which case the stats go to <dir>/<name>.prof for pstats or snakeviz.
+    """
+    profile_dir = os.environ.get(profile_dir_env)
+    if not profile_dir:
+        return function(*args)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args)
+    finally:
+        os.makedirs(profile_dir, exist_ok=True)
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        profile.dump_stats(Path(profile_dir) / f"{safe_name}.prof")
+
+
+def totals(entries: List[dict]) -> List[dict]:
+    """Steps of all `entries` merged by name, slowest first"""
+    records = merge(record for entry in entries for record in entry.get("steps", []))
+    return sorted(records, key=lambda record: -record["seconds"])
+
+
+def write_report(dir: Path, name: str, entries: List[dict], started: float) -> Path:
+    """
+    Writes the JSON run report <dir>/<name> with one entry per stage or match
+    (its wall time, status and steps) and the step totals across them.
+    """
+    report = {
+        "started": started,
+        "finished": time.time(),
+        "host": platform.node(),
+        "argv": sys.argv,
+        "entries": entries,
+        "totals": totals(entries),
+    }
+    with tempfile.NamedTemporaryFile("w", dir=dir, suffix=".tmp", delete=False) as f:
+        json.dump(report, f, indent=1)
+    os.replace(f.name, dir / name)
+    return dir / name
+
+
+def set_profile_dir(profile_dir: Optional[str]):
+    """Enables profiled() in this process and in workers started after it"""
+    if profile_dir is not None:
+        os.environ[profile_dir_env] = str(Path(profile_dir).resolve())
@@ -0,0 +1,99 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+# Same aliases as db.sh, so both sources expose the _imu.csv column names
+imu_aliases = {
+    "timestamp": "timestamp",
+    "orientW": "rotation_w",
+    "orientX": "rotation_x",
+    "orientY": "rotation_y",
+    "orientZ": "rotation_z",
+    "magOrientW": "geomag_rotation_w",
+    "magOrientX": "geomag_rotation_x",
+    "magOrientY": "geomag_rotation_y",
+    "magOrientZ": "geomag_rotation_z",
+    "accX": "raw_acceleration_x",
+    "accY": "raw_acceleration_y",
+    "accZ": "raw_acceleration_z",
+    "gyroX": "raw_angular_x",
+    "gyroY": "raw_angular_y",
+    "gyroZ": "raw_angular_z",
+    "magX": "raw_magnetic_x",
+    "magY": "raw_magnetic_y",
+    "magZ": "raw_magnetic_z",
+}
+ble_columns = ["timestamp", "major", "minor", "rssi"]
+ble_major = 10004
+
+fetch_size = 65536
+
+
+def connect(db_file: Path) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+
+
+def fetch_array(connection: sqlite3.Connection, query: str, n_columns: int):
+    """Runs `query`, fetching rows in `fetch_size` chunks into a float64 array"""
+    cursor = connection.execute(query)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if len(rows) == 0:
+            break
+        chunks.append(np.array(rows, dtype=np.float64))
+    if len(chunks) == 0:
+        return np.empty((0, n_columns))
+    return np.concatenate(chunks)
+
+
+def read_imu(db_file: Path, columns: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Timestamps and (n, len(columns)) `columns` of the imu table, by timestamp"""
+    select = ", ".join(
+        [f"{imu_aliases[column]} AS {column}" for column in ["timestamp", *columns]]
+    )
+    with closing(connect(db_file)) as connection:
+        data = fetch_array(
+            connection,
+            f"SELECT {select} FROM imu ORDER BY timestamp",
+            len(columns) + 1,
+        )
+    return data[:, 0], data[:, 1:]
+
+
+def read_ble(db_file: Path) -> np.ndarray:
+    """(n, 4) timestamp, major, minor, rssi of every beac% table, by timestamp"""
+    with closing(connect(db_file)) as connection:
+        tables = [
+            row[0]
+            for row in connection.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'table' AND name LIKE 'beac%' ORDER BY name"
+            )
+        ]
+        if len(tables) == 0:
+            return np.empty((0, len(ble_columns)))
+        union = " UNION ALL ".join(
+            [
+                f"SELECT {', '.join(ble_columns)} FROM {table} "
+                f"WHERE major = {ble_major} AND rssi != 0"
+                for table in tables
+            ]
+        )
+        return fetch_array(
+            connection, f"SELECT * FROM ({union}) ORDER BY timestamp", len(ble_columns)
+        )
+
+
+def read_time_range(db_file: Path) -> Tuple[float, float]:
+    """First and last imu timestamp without reading the table"""
+    with closing(connect(db_file)) as connection:
+        start, end = connection.execute(
+            "SELECT MIN(timestamp), MAX(timestamp) FROM imu"
+        ).fetchone()
+    if start is None:
+        raise ValueError(f"{db_file} has no imu rows")
+    return float(start), float(end)
@@ -0,0 +1,600 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import auto_align
+import batch_gt
+import csv_to_npy
+import imu_gt
+import metrics
+import split_ble
+import split_imu
+from auto_align import alignment_columns
+from gt import file_hash
+from loaders import (
+    alignment_confidence,
+    aria_sensor_suffixes,
+    read_alignment,
+    read_columns,
+    sidecar_file,
+    sidecar_header_file,
+)
+from sessions import dir_match
+from writers import binary_formats
+
+pipeline_state_file = ".pipeline_state.json"
+pipeline_report_file = "pipeline_report.json"
+vrs_exec = Path(__file__).resolve().parent / (
+    "vivek_vrs_mac" if platform.system() == "Darwin" else "vivek_vrs"
+)
+
+
+class Stage:
+    """
+    One step of the pipeline for one directory. It is skipped when its params
+    and the content of its `inputs` match the last successful run and all of
+    its `outputs` exist. `action(*args)` runs in a worker process and its
+    return value is kept in the state as the stage result.
+    """
+
+    def __init__(self, dir: Path, key: str, inputs, outputs, params, action, *args):
+        self.dir = dir
+        self.key = key
+        self.inputs = [Path(file) for file in inputs]
+        self.outputs = [Path(file) for file in outputs]
+        self.params = params
+        self.action = action
+        self.args = args
+
+
+def read_state(dir: Path) -> Dict[str, dict]:
+    try:
+        with open(dir / pipeline_state_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_state(dir: Path, state: Dict[str, dict]):
+    """Replaces the state file atomically so a crash never leaves it truncated"""
+    with tempfile.NamedTemporaryFile("w", dir=dir, suffix=".tmp", delete=False) as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(f.name, dir / pipeline_state_file)
+
+
+def fingerprint(file: Path, previous: Optional[dict] = None) -> dict:
+    """Size, mtime and content hash of `file`, rehashed only if size/mtime moved"""
+    stat = file.stat()
+    if (
+        previous is not None
+        and previous["size"] == stat.st_size
+        and previous["mtime"] == stat.st_mtime
+    ):
+        return previous
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "hash": file_hash(file)}
+
+
+def is_fresh(stage: Stage, record: Optional[dict]) -> bool:
+    if record is None or record["params"] != stage.params:
+        return False
+    if not all(file.exists() for file in stage.outputs):
+        return False
+    inputs = record["inputs"]
+    for file in stage.inputs:
+        previous = inputs.get(file.name)
+        if previous is None or not file.exists():
+            return False
+        if fingerprint(file, previous)["hash"] != previous["hash"]:
+            return False
+    return True
+
+
+def run_action(name: str, action, *args):
+    """
+    Runs a stage action, profiled if enabled, returns its wall time, result,
+    any traceback and the metrics steps it recorded
+    """
+    metrics.collect()
+    start = time.time()
+    try:
+        result = metrics.profiled(name, action, *args)
+    except Exception:
+        return time.time() - start, None, traceback.format_exc(), metrics.collect()
+    return time.time() - start, result, None, metrics.collect()
+
+
+def run_stages(
+    stages: List[Stage],
+    states: Dict[Path, dict],
+    jobs=None,
+    force=False,
+    initializer=None,
+    entries: Optional[Dict[Path, List[dict]]] = None,
+) -> int:
+    """
+    Runs the stale `stages` of one level on a process pool. Each success is
+    recorded and written to its directory state immediately, so a failed or
+    interrupted run resumes from there. Every stage, run or fresh, is added to
+    the `entries` of its directory for the run report. Returns the number of
+    failures.
+    """
+    entries = {} if entries is None else entries
+    stale = []
+    for stage in stages:
+        if force or not is_fresh(stage, states[stage.dir].get(stage.key)):
+            stale.append(stage)
+        else:
+            entries.setdefault(stage.dir, []).append(
+                {"stage": stage.key, "seconds": 0.0, "status": "fresh", "steps": []}
+            )
+    logging.info(f"{len(stale)}/{len(stages)} stages to run")
+    if len(stale) == 0:
+        return 0
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer) as pool:
+        futures = {
+            pool.submit(
+                run_action, f"{stage.dir.name}_{stage.key}", stage.action, *stage.args
+            ): stage
+            for stage in stale
+        }
+        for future in as_completed(futures):
+            stage = futures[future]
+            name = f"{stage.dir.name}/{stage.key}"
+            try:
+                elapsed, result, error, steps = future.result()
+            except Exception:
+                elapsed, result, error, steps = 0.0, None, traceback.format_exc(), []
+            missing = [str(file) for file in stage.outputs if not file.exists()]
+            if error is None and len(missing) > 0:
+                error = f"Missing outputs {missing}"
+            entries.setdefault(stage.dir, []).append(
+                {
+                    "stage": stage.key,
+                    "seconds": elapsed,
+                    "status": "ok" if error is None else "failed",
+                    "steps": steps,
+                }
+            )
+            if error is not None:
+                failures += 1
+                logging.error(f"Failed {name} after {elapsed:.1f}s\n{error}")
+                continue
+            logging.info(f"Finished {name} in {elapsed:.1f}s")
+            state = states[stage.dir]
+            previous = state.get(stage.key, {}).get("inputs", {})
+            state[stage.key] = {
+                "params": stage.params,
+                "inputs": {
+                    file.name: fingerprint(file, previous.get(file.name))
+                    for file in stage.inputs
+                },
+                "result": result,
+            }
+            write_state(stage.dir, state)
+    return failures
+
+
+def run_vrs(executable: Path, vrs: Path):
+    subprocess.run([str(executable), str(vrs)], check=True)
+
+
+def run_sidecar(file: Path):
+    with metrics.step("to_npy") as step:
+        sidecar = csv_to_npy.to_npy(file)
+        step.rows = len(np.load(sidecar, mmap_mode="r"))
+        step.read(file)
+        step.wrote(sidecar)
+
+
+def run_gt(
+    alignment: Path,
+    truth_idx: int,
+    match,
+    imu_format,
+    ble_format,
+    segments,
+    stride,
+    max_angle,
+):
+    _, error = batch_gt.run_job(
+        alignment, truth_idx, match, imu_format, ble_format, segments, stride, max_angle
+    )
+    if error is not None:
+        raise RuntimeError(error)
+
+
+def run_split(imu_files: List[Path], ble_files: List[Path]):
+    if len(imu_files) > 0:
+        with metrics.step("split_imu") as step:
+            step.rows = sum(split_imu.split_files(imu_files))
+            step.read(*imu_files)
+    if len(ble_files) > 0:
+        with metrics.step("split_ble") as step:
+            step.rows = sum(split_ble.split_files(ble_files))
+            step.read(*ble_files)
+
+
+def vrs_stages(dir: Path, executable=vrs_exec) -> List[Stage]:
+    return [
+        Stage(
+            dir,
+            f"vrs:{vrs.name}",
+            [vrs],
+            [dir / (vrs.stem + "_IMU_1.csv"), dir / (vrs.stem + "_Time_1.csv")],
+            {},
+            run_vrs,
+            executable,
+            vrs,
+        )
+        for vrs in sorted(dir.glob("*.vrs"))
+    ]
+
+
+def sidecar_stages(dir: Path) -> List[Stage]:
+    return [
+        Stage(
+            dir,
+            f"npy:{file.name}",
+            [file],
+            [sidecar_file(file), sidecar_header_file(file)],
+            {},
+            run_sidecar,
+            file,
+        )
+        for suffix in aria_sensor_suffixes
+        for file in sorted(dir.glob("*" + suffix))
+    ]
+
+
+def match_inputs(dir: Path, db_file: str, aria_file: str, ble=False) -> List[Path]:
+    """Files a match reads; with `ble` also the BLE export if there is no .db"""
+    db = dir / db_file
+    inputs = [
+        db if db.exists() else dir / (db_file + "_imu.csv"),
+        dir / (aria_file + "_Time_1.csv"),
+        dir / (aria_file + "_IMU_1.csv"),
+    ]
+    if ble and not db.exists():
+        inputs.append(dir / (db_file + "_ble.csv"))
+    return inputs
+
+
+def align_stages(dir: Path, max_offset, clock_segments) -> List[Stage]:
+    """auto_align of every phone session matched in `dir`"""
+    clock_segments = max(clock_segments, 1)
+    stages = []
+    for match in dir_match(dir):
+        db_file, aria_file = Path(match[0]).name, Path(match[1]).name
+        stages.append(
+            Stage(
+                dir,
+                f"align:{db_file}",
+                match_inputs(dir, db_file, aria_file),
+                [],
+                {
+                    "aria_file": aria_file,
+                    "max_offset": max_offset,
+                    "clock_segments": clock_segments,
+                },
+                auto_align.auto_align,
+                match,
+                max_offset,
+                clock_segments,
+            )
+        )
+    return stages
+
+
+def write_alignment(dir: Path, stages: List[Stage], state: dict, realign=False):
+    """
+    Writes the align stage results to alignment.auto.csv and adds the sessions
+    missing from alignment.csv to it. Existing rows keep their (possibly
+    hand-edited or reviewed) values and position, so traj indices stay stable
+    when sessions are added; with `realign` they are replaced by the results.
+    """
+    alignment = dir / "alignment.csv"
+    rows = read_alignment(alignment) if alignment.exists() else []
+    by_db = {row["db_file"]: row for row in rows}
+    auto_rows = []
+    for stage in stages:
+        record = state.get(stage.key)
+        if record is None:
+            continue
+        db_file = stage.key.split(":", 1)[1]
+        row = {column: str(record["result"][column]) for column in alignment_columns}
+        auto_rows.append(row)
+        if db_file not in by_db:
+            rows.append(row)
+            by_db[db_file] = row
+        elif realign:
+            by_db[db_file].update(row)
+    for file, file_rows in ((dir / "alignment.auto.csv", auto_rows), (alignment, rows)):
+        with open(file, "w") as alignment_file:
+            writer = csv.DictWriter(alignment_file, fieldnames=alignment_columns)
+            writer.writeheader()
+            writer.writerows(file_rows)
+    return alignment
+
+
+def gt_stages(
+    dir: Path, imu_format, ble_format, clock_segments, stride=1, max_angle=None
+) -> List[Stage]:
+    alignment = dir / "alignment.csv"
+    stages = []
+    for truth_idx, match in enumerate(read_alignment(alignment)):
+        inputs = match_inputs(dir, match["db_file"], match["aria_file"], ble=True)
+        inputs.append(dir / (match["aria_file"] + ".euroc"))
+        ble_name = (
+            f"traj_{truth_idx}.{ble_format}"
+            if ble_format in ("vvk", "vvb")
+            else f"traj_{truth_idx}_ble.{ble_format}"
+        )
+        stages.append(
+            Stage(
+                dir,
+                f"gt:{truth_idx}",
+                inputs,
+                [dir / f"traj_{truth_idx}.{imu_format}", dir / ble_name],
+                {
+                    "match": dict(match),
+                    "imu_format": imu_format,
+                    "ble_format": ble_format,
+                    "clock_segments": clock_segments,
+                    "stride": stride,
+                    "max_angle": max_angle,
+                },
+                run_gt,
+                alignment,
+                truth_idx,
+                match,
+                imu_format,
+                ble_format,
+                clock_segments,
+                stride,
+                max_angle,
+            )
+        )
+    return stages
+
+
+def first_timestamp(file: Path) -> float:
+    """First timestamp of a traj output, inf if it has none or cannot be read"""
+    try:
+        if file.suffix == ".vvk":
+            with open(file, "r") as f:
+                return float(f.readline().split(":")[0])
+        return float(read_columns(file, ["timestamp"], 1)[0, 0])
+    except (OSError, ValueError, IndexError):
+        return np.inf
+
+
+def chronological(files: List[Path]) -> List[Path]:
+    """
+    `files` by their first timestamp, so that the chronological split ends
+    with the latest sessions whatever their truth index (alignment.csv rows
+    follow the .db names) and traj_10 does not sort before traj_2
+    """
+    return sorted(files, key=lambda file: (first_timestamp(file), file.name))
+
+
+def split_stages(dir: Path, imu_format, ble_format) -> List[Stage]:
+    imu_files = chronological(
+        [
+            file
+            for file in dir.glob(f"traj_*.{imu_format}")
+            if not file.stem.endswith("_ble")
+        ]
+    )
+    ble_files = (
+        chronological(list(dir.glob("traj_*.vvk"))) if ble_format == "vvk" else []
+    )
+    if len(imu_files) + len(ble_files) == 0:
+        return []
+    outputs = []
+    if len(imu_files) > 0:
+        split_dir = dir / f"{dir.name}_{imu_format}"
+        outputs.append(split_dir / "test" / f"traj_0.{imu_format}")
+    if len(ble_files) > 0:
+        outputs.append(dir / f"{dir.name}_vvk" / "test.vvk")
+    return [
+        Stage(
+            dir,
+            "split",
+            imu_files + ble_files,
+            outputs,
+            {},
+            run_split,
+            imu_files,
+            ble_files,
+        )
+    ]
+
+
+def run(
+    dirs: List[Path],
+    jobs=None,
+    imu_format="csv",
+    ble_format="vvk",
+    clock_segments=0,
+    stride=1,
+    max_angle=None,
+    max_offset=None,
+    min_confidence=0.1,
+    review=False,
+    realign=False,
+    split=True,
+    force=False,
+    executable=vrs_exec,
+) -> int:
+    """
+    Runs every stage of `dirs` level by level and writes a pipeline_report.json
+    per directory, returns the failure count. Alignments below `min_confidence`
+    are logged, and only opened in the alignment GUI with `review`. Rows already
+    in alignment.csv are only replaced by new alignments with `realign`.
+    """
+    started = time.time()
+    states = {dir: read_state(dir) for dir in dirs}
+    entries: Dict[Path, List[dict]] = {dir: [] for dir in dirs}
+    failures = 0
+    logging.info("VRS extraction")
+    failures += run_stages(
+        [stage for dir in dirs for stage in vrs_stages(dir, executable)],
+        states,
+        jobs,
+        force,
+        entries=entries,
+    )
+    logging.info("Sensor csv sidecars")
+    failures += run_stages(
+        [stage for dir in dirs for stage in sidecar_stages(dir)],
+        states,
+        jobs,
+        force,
+        entries=entries,
+    )
+
+    logging.info("Alignment")
+    align = {}
+    for dir in dirs:
+        try:
+            align[dir] = align_stages(dir, max_offset, clock_segments)
+        except (OSError, ValueError) as e:
+            failures += 1
+            logging.error(f"Skipping {dir}: {e}")
+            entries[dir].append(
+                {
+                    "stage": "match",
+                    "seconds": 0.0,
+                    "status": "failed",
+                    "error": str(e),
+                    "steps": [],
+                }
+            )
+    report_dirs, dirs = dirs, [dir for dir in dirs if dir in align]
+    failures += run_stages(
+        [stage for dir in dirs for stage in align[dir]],
+        states,
+        jobs,
+        force,
+        entries=entries,
+    )
+    for dir in dirs:
+        alignment = write_alignment(dir, align[dir], states[dir], realign)
+        low = [
+            row
+            for row in read_alignment(alignment)
+            if alignment_confidence(row) < min_confidence
+        ]
+        for row in low:
+            logging.warning(
+                f"Low confidence {alignment_confidence(row):.2f}: "
+                f"{row['aria_file']}->{row['db_file']}"
+            )
+        if len(low) > 0 and review:
+            import imu_alignment
+
+            imu_alignment.review(alignment, min_confidence)
+
+    logging.info("IMU and BLE GT")
+    failures += run_stages(
+        [
+            stage
+            for dir in dirs
+            for stage in gt_stages(
+                dir, imu_format, ble_format, clock_segments, stride, max_angle
+            )
+        ],
+        states,
+        jobs,
+        force,
+        batch_gt.init_worker,
+        entries,
+    )
+
+    if split:
+        logging.info("Train/val/test splits")
+        failures += run_stages(
+            [
+                stage
+                for dir in dirs
+                for stage in split_stages(dir, imu_format, ble_format)
+            ],
+            states,
+            jobs,
+            force,
+            entries=entries,
+        )
+    for dir in report_dirs:
+        metrics.write_report(dir, pipeline_report_file, entries[dir], started)
+    logging.info(f"Done with {failures} failed stages")
+    return failures
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s",
+        level=logging.INFO,
+        datefmt="%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dirs", nargs="+")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--format", default="csv", choices=["csv", *binary_formats])
+    parser.add_argument(
+        "--ble-format", default="vvk", choices=["vvk", "vvb", *binary_formats]
+    )
+    parser.add_argument("--clock-segments", type=int, default=0)
+    imu_gt.add_frame_arguments(parser)
+    parser.add_argument("--max-offset", type=float, default=None)
+    parser.add_argument("--min-confidence", type=float, default=0.1)
+    parser.add_argument(
+        "--review",
+        action="store_true",
+        help="open the alignment GUI on rows below --min-confidence",
+    )
+    parser.add_argument(
+        "--realign",
+        action="store_true",
+        help="replace existing alignment.csv rows with the auto alignments",
+    )
+    parser.add_argument("--no-split", action="store_true")
+    parser.add_argument(
+        "--force", action="store_true", help="rerun every stage regardless of state"
+    )
+    parser.add_argument("--vrs-exec", default=str(vrs_exec))
+    parser.add_argument(
+        "--profile", metavar="DIR", help="write a cProfile .prof per stage to DIR"
+    )
+    args = parser.parse_args()
+    metrics.set_profile_dir(args.profile)
+    failures = run(
+        [Path(dir).resolve() for dir in args.dirs],
+        args.jobs,
+        args.format,
+        args.ble_format,
+        args.clock_segments,
+        args.stride,
+        args.max_angle,
+        args.max_offset,
+        args.min_confidence,
+        args.review,
+        args.realign,
+        not args.no_split,
+        args.force,
+        Path(args.vrs_exec),
+    )
+    sys.exit(1 if failures > 0 else 0)
@@ -1,23 +1,14 @@
-import csv
 import sys
 from pathlib import Path
 
-import numpy as np
 from matplotlib import pyplot as plt
 
+from loaders import read_columns
+
 
 def plot_traj(filename: Path):
-    reader = csv.DictReader(open(filename, "r"))
-    txyz = np.array(
-        [
-            [
-                float(row["timestamp"]),
-                float(row["processedPosX"]),
-                float(row["processedPosY"]),
-                float(row["processedPosZ"]),
-            ]
-            for row in reader
-        ]
+    txyz = read_columns(
+        filename, ["timestamp", "processedPosX", "processedPosY", "processedPosZ"]
     )
     _, axes = plt.subplots(3, 1)
     axes[0].plot(txyz[:, 1], txyz[:, 2])
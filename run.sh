@@ -15,17 +15,17 @@ else
   exit 1
 fi
 
+dirs=()
 for val in "$@"
 do
-  dir=$(cd -- "$SCRIPT_DIR/$val" && pwd)
-  echo "Running on $dir"
-  find "$dir" -type f -name "*.vrs" | xargs -I {} "$VRS_EXEC" "{}"
-  find "$dir" -type f -name "*.db" | xargs -I {} "$SCRIPT_DIR/db.sh" "{}"
-  python3 "$SCRIPT_DIR/imu_alignment.py" "$dir" > "$dir/alignment.csv"
-  python3 "$SCRIPT_DIR/imu_gt.py" "$dir/alignment.csv"
-  python3 "$SCRIPT_DIR/ble_gt.py" "$dir/alignment.csv"
-  if [ "$SPLIT_GEN_FILES" = true ]; then
-    find "$dir" -type f -name "traj*.csv" | xargs python3 "$SCRIPT_DIR/split_imu.py"
-    find "$dir" -type f -name "traj*.vvk" | xargs python3 "$SCRIPT_DIR/split_ble.py"
-  fi
+  dirs+=("$(cd -- "$SCRIPT_DIR/$val" && pwd)")
 done
+
+# Stages whose inputs and parameters are unchanged since their last successful
+# run are skipped, run pipeline.py --force to recompute everything. Low confidence
+# alignments open the alignment GUI, drop --review on headless hosts
+split_flag=()
+if [ "$SPLIT_GEN_FILES" != true ]; then
+  split_flag=(--no-split)
+fi
+python3 "$SCRIPT_DIR/pipeline.py" --vrs-exec "$VRS_EXEC" --review "${split_flag[@]}" "${dirs[@]}"
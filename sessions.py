@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import phone_db
+from clock import ClockModel, load_clock
+from loaders import header_name, load_phone_imu, read_columns
+
+session_index_file = "session_index.json"
+
+
+def read_time_range(file: Path, column: str, scale=1.0) -> Tuple[float, float]:
+    """First and last `column` value of a csv, reading only its head and tail"""
+    with open(file, "rb") as f:
+        header = [header_name(name) for name in f.readline().decode().split(",")]
+        idx = header.index(column)
+        first = f.readline().decode()
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 4096, 0))
+        last = f.read().decode(errors="ignore").strip().splitlines()[-1]
+    if first.strip() == "":
+        raise ValueError(f"{file} has no rows")
+    return float(first.split(",")[idx]) * scale, float(last.split(",")[idx]) * scale
+
+
+def build_index(dir: Path) -> Dict[str, Dict[str, float]]:
+    """
+    Start/end real time (seconds) of every phone .db (or its _imu.csv export)
+    and Aria _Time_1.csv in `dir`, persisted as a session_index.json manifest.
+    Files whose size and mtime are unchanged are not reopened.
+    """
+    manifest = dir / session_index_file
+    try:
+        with open(manifest, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    new_index = {}
+    for entry in os.scandir(dir):
+        if entry.name.endswith(".db"):
+            column, scale = None, 1.0
+        elif entry.name.endswith("_imu.csv"):
+            column, scale = "timestamp", 1.0
+        elif entry.name.endswith("_Time_1.csv"):
+            column, scale = "realtime", 1e-9
+        else:
+            continue
+        stat = entry.stat()
+        cached = index.get(entry.name)
+        if (
+            cached is not None
+            and cached["size"] == stat.st_size
+            and cached["mtime"] == stat.st_mtime
+        ):
+            new_index[entry.name] = cached
+            continue
+        try:
+            if column is None:
+                start, end = phone_db.read_time_range(Path(entry.path))
+            else:
+                start, end = read_time_range(Path(entry.path), column, scale)
+        except (ValueError, IndexError, sqlite3.Error):
+            continue
+        new_index[entry.name] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "start": start,
+            "end": end,
+        }
+    if new_index != index:
+        with open(manifest, "w") as f:
+            json.dump(new_index, f, indent=1, sort_keys=True)
+    return new_index
+
+
+def match(
+    interval: Tuple[float, float], starts: np.ndarray, ends: np.ndarray
+) -> Tuple[int, float]:
+    """
+    Index of the interval (sorted by `starts`) overlapping `interval` the most
+    and the overlapped fraction of `interval`. Falls back to the closest start
+    when nothing overlaps.
+    """
+    start, end = interval
+    candidates = np.searchsorted(starts, end, side="left")
+    overlap = np.minimum(ends[:candidates], end) - np.maximum(
+        starts[:candidates], start
+    )
+    if candidates > 0 and overlap.max() > 0:
+        best = int(np.argmax(overlap))
+        return best, float(overlap[best] / max(end - start, 1e-9))
+    return int(np.argmin(np.abs(starts - start))), 0.0
+
+
+def dir_match(dir: Path) -> List[Tuple[str, str]]:
+    if not os.path.isdir(dir):
+        raise NotADirectoryError(f"{dir} is no directory")
+    index = build_index(dir)
+    # A .db and its _imu.csv export are the same session, prefer the .db
+    db_files = {name: name for name in index if name.endswith(".db")}
+    for name in index:
+        if name.endswith("_imu.csv"):
+            db_files.setdefault(name[:-8], name)
+    vrs_time_files = sorted(
+        (name for name in index if name.endswith("_Time_1.csv")),
+        key=lambda name: index[name]["start"],
+    )
+    if len(vrs_time_files) == 0:
+        raise FileNotFoundError(f"No _Time_1.csv in {dir}")
+    starts = np.array([index[name]["start"] for name in vrs_time_files])
+    ends = np.array([index[name]["end"] for name in vrs_time_files])
+    matches: List[Tuple[str, str]] = []
+    for db_file, index_name in sorted(db_files.items()):
+        best, score = match(
+            (index[index_name]["start"], index[index_name]["end"]), starts, ends
+        )
+        print("Overlap:", score, file=sys.stderr)
+        matches.append((str(dir / db_file), str(dir / vrs_time_files[best])[:-11]))
+    return matches
+
+
+def time_map_params(match: Tuple[str, str]) -> Tuple[float, float]:
+    """Scale and offset (seconds) mapping Aria timestamps to phone real time"""
+    clock = load_clock(Path(match[1] + "_Time_1.csv"))
+    return clock.scale, clock.offset
+
+
+def load_phone_accel(db_file: Path):
+    """Phone (timestamp, accX, accY, accZ) in m/s^2"""
+    db_timestamps, db_acc = load_phone_imu(db_file, ["accX", "accY", "accZ"])
+    db_imu_data = np.column_stack([db_timestamps, db_acc])
+    db_imu_data[:, 1:] *= -9.8
+    return db_imu_data
+
+
+def load_aria_accel(aria_imu: Path, time_map):
+    """Aria (timestamp, accX, accY, accZ), timestamps mapped by `time_map`"""
+    aria_imu_data = read_columns(aria_imu, ["timestamp", "accX", "accY", "accZ"])
+    return np.column_stack([time_map(aria_imu_data[:, 0]), aria_imu_data[:, 1:]])
+
+
+def load_imu(
+    db_file: Path,
+    aria_imu: Path,
+    scale: float,
+    offset: float,
+    clock: Optional[ClockModel] = None,
+):
+    """
+    Phone and Aria (timestamp, accX, accY, accZ) in m/s^2 on the phone clock.
+    Aria timestamps go through `clock` when given, else scale * t + offset.
+    """
+    time_map = clock.to_real if clock is not None else lambda x: scale * x + offset
+    return load_phone_accel(db_file), load_aria_accel(aria_imu, time_map)
+
+
+def load_match(match: Tuple[str, str], clock_segments=1):
+    """Phone and Aria accel of a (db_file, aria_file) match plus its time map"""
+    clock = load_clock(Path(match[1] + "_Time_1.csv"), clock_segments)
+    db_imu_data, aria_imu_data = load_imu(
+        Path(match[0]),
+        Path(match[1] + "_IMU_1.csv"),
+        clock.scale,
+        clock.offset,
+        clock if clock_segments > 1 else None,
+    )
+    return db_imu_data, aria_imu_data, clock.scale, clock.offset
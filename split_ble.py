@@ -1,30 +1,29 @@
+import argparse
 import os
-import sys
 from pathlib import Path
 
-if __name__ == "__main__":
-    files = [Path(f).resolve() for f in sys.argv[1:]]
-    assert len(files) > 0
-    data = []
-    for file in files:
-        with open(file, "r") as f:
-            for row in f:
-                data.append(row)
-    train_split = int(0.7 * len(data))
-    val_split = int(0.1 * len(data))
+from splits import add_arguments, split_names, split_text
 
-    train_data = data[:train_split]
-    val_data = data[train_split : train_split + val_split]
-    test_data = data[train_split + val_split :]
 
+def split_files(files, per_session=False, seed=None):
+    """Splits .vvk files into train/val/test.vvk under <dir>/<dir>_vvk"""
+    assert len(files) > 0
     dir = files[0].parent / (str(files[0].parent.name) + "_vvk")
     os.makedirs(dir, exist_ok=True)
+    return split_text(
+        files,
+        [dir / f"{name}.vvk" for name in split_names],
+        False,
+        per_session,
+        seed,
+    )
 
-    with open(dir / "train.vvk", "w+") as outfile:
-        outfile.writelines(train_data)
 
-    with open(dir / "val.vvk", "w+") as outfile:
-        outfile.writelines(val_data)
-
-    with open(dir / "test.vvk", "w+") as outfile:
-        outfile.writelines(test_data)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    rows = split_files(
+        [Path(f).resolve() for f in args.files], args.per_session, args.seed
+    )
+    print(", ".join(f"{name}: {n}" for name, n in zip(split_names, rows)))
@@ -1,45 +1,59 @@
+import argparse
 import os
-import sys
 from pathlib import Path
 
-if __name__ == "__main__":
-    files = [Path(f).resolve() for f in sys.argv[1:]]
+from loaders import binary_suffixes, read_columns, read_header
+from splits import add_arguments, plan_splits, split_names, split_text
+from writers import write_table
+
+
+def split_binary(files, outputs, per_session=False, seed=None):
+    """
+    Splits binary traj files, reading one file at a time per split so that
+    feather/parquet outputs are streamed as record batches.
+    """
+    header = read_header(files[0])
+    for file in files[1:]:
+        new_header = read_header(file)
+        assert header == new_header, f"{header} != {new_header}"
+    rows = [len(read_columns(file, header[:1])) for file in files]
+    order, counts = plan_splits(rows, per_session, seed)
+
+    def chunks(split):
+        for i, file_counts in zip(order, counts):
+            if file_counts[split] > 0:
+                start = sum(file_counts[:split])
+                data = read_columns(files[i], header)
+                yield data[start : start + file_counts[split]]
+
+    return [
+        write_table(output, header, chunks(split))
+        for split, output in enumerate(outputs)
+    ]
+
+
+def split_files(files, per_session=False, seed=None):
+    """Splits traj files into train/val/test under <dir>/<dir>_<suffix>"""
     assert len(files) > 0
-    header = ""
-    data = []
-    for file in files:
-        with open(file, "r") as f:
-            if header == "":
-                header = f.__next__()
-            else:
-                new_header = f.__next__()
-                assert header == new_header, f"{header} != {new_header}"
-            for row in f:
-                data.append(row)
-    train_split = int(0.7 * len(data))
-    val_split = int(0.1 * len(data))
-
-    train_data = data[:train_split]
-    val_data = data[train_split : train_split + val_split]
-    test_data = data[train_split + val_split :]
-
-    dir = files[0].parent / (str(files[0].parent.name) + "_csv")
-    train_dir = dir / "train"
-    val_dir = dir / "val"
-    test_dir = dir / "test"
-    os.makedirs(dir, exist_ok=True)
-    os.makedirs(train_dir, exist_ok=True)
-    os.makedirs(val_dir, exist_ok=True)
-    os.makedirs(test_dir, exist_ok=True)
-
-    with open(train_dir / "traj_0.csv", "w+") as outfile:
-        outfile.write(header)
-        outfile.writelines(train_data)
-
-    with open(val_dir / "traj_0.csv", "w+") as outfile:
-        outfile.write(header)
-        outfile.writelines(val_data)
-
-    with open(test_dir / "traj_0.csv", "w+") as outfile:
-        outfile.write(header)
-        outfile.writelines(test_data)
+    suffix = files[0].suffix
+    assert all(file.suffix == suffix for file in files), files
+
+    dir = files[0].parent / (str(files[0].parent.name) + "_" + suffix[1:])
+    outputs = []
+    for name in split_names:
+        os.makedirs(dir / name, exist_ok=True)
+        outputs.append(dir / name / f"traj_0{suffix}")
+
+    if suffix in binary_suffixes:
+        return split_binary(files, outputs, per_session, seed)
+    return split_text(files, outputs, True, per_session, seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    rows = split_files(
+        [Path(f).resolve() for f in args.files], args.per_session, args.seed
+    )
+    print(", ".join(f"{name}: {n}" for name, n in zip(split_names, rows)))
@@ -0,0 +1,198 @@
+import argparse
+import logging
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+
+split_names = ["train", "val", "test"]
+block_size = 1 << 20
+
+
+def split_counts(rows: int) -> List[int]:
+    """Rows of a 70/10/20 train/val/test split of `rows`"""
+    train, val = int(0.7 * rows), int(0.1 * rows)
+    return [train, val, rows - train - val]
+
+
+def assign_sessions(rows: List[int], order: List[int]) -> List[int]:
+    """
+    Split of every session in `order`, chosen so that each split's row count
+    gets close to its 70/10/20 target. With 3 or more sessions val and test
+    first take the session closest to their target and never end up empty.
+    The rest go in `order` to the split furthest below its target, then
+    sessions are moved or swapped between splits while that brings the
+    splits closer to their targets.
+    """
+    targets = split_counts(sum(rows))
+    splits = {}
+    if len(order) >= 3:
+        for split in (1, 2):
+            closest = min(
+                (i for i in order if i not in splits),
+                key=lambda i: abs(rows[i] - targets[split]),
+            )
+            splits[closest] = split
+    assigned = [sum(rows[i] for i in splits if splits[i] == j) for j in range(3)]
+    for i in order:
+        if i not in splits:
+            splits[i] = int(np.argmax(np.subtract(targets, assigned)))
+            assigned[splits[i]] += rows[i]
+
+    def error(assigned):
+        return sum(abs(n - target) for n, target in zip(assigned, targets))
+
+    def sessions(split):
+        return sum(splits[i] == split for i in order)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in order:
+            for split in range(3):
+                moved = list(assigned)
+                moved[splits[i]] -= rows[i]
+                moved[split] += rows[i]
+                if error(moved) < error(assigned) and (
+                    len(order) < 3 or splits[i] == 0 or sessions(splits[i]) > 1
+                ):
+                    splits[i], assigned = split, moved
+                    improved = True
+        for i in order:
+            for j in order:
+                if splits[i] < splits[j]:
+                    swapped = list(assigned)
+                    swapped[splits[i]] += rows[j] - rows[i]
+                    swapped[splits[j]] += rows[i] - rows[j]
+                    if error(swapped) < error(assigned):
+                        splits[i], splits[j] = splits[j], splits[i]
+                        assigned = swapped
+                        improved = True
+    return [splits[i] for i in order]
+
+
+def plan_splits(
+    rows: List[int], per_session=False, seed: Optional[int] = None
+) -> Tuple[List[int], List[List[int]]]:
+    """
+    Order in which to copy the sessions (files) with `rows` rows each and how
+    many consecutive rows of each go to train, val and test. By default the
+    sessions are joined in order and split chronologically; `per_session`
+    splits every session on its own. A `seed` shuffles whole sessions, which
+    then go entirely to one split (see `assign_sessions`) unless `per_session`
+    is also given. Logs a warning for every split left empty.
+    """
+    order = list(range(len(rows)))
+    if seed is not None:
+        order = np.random.default_rng(seed).permutation(len(rows)).tolist()
+    if per_session:
+        counts = [split_counts(rows[i]) for i in order]
+    elif seed is not None:
+        counts = [
+            [rows[i] if j == split else 0 for j in range(3)]
+            for i, split in zip(order, assign_sessions(rows, order))
+        ]
+    else:
+        bounds = np.cumsum(split_counts(sum(rows)))
+        lows = np.concatenate([[0], bounds[:-1]])
+        counts = []
+        start = 0
+        for i in order:
+            counts.append(
+                np.clip(
+                    np.minimum(bounds, start + rows[i]) - np.maximum(lows, start),
+                    0,
+                    None,
+                ).tolist()
+            )
+            start += rows[i]
+    for j, name in enumerate(split_names):
+        if sum(rows) > 0 and sum(file_counts[j] for file_counts in counts) == 0:
+            logging.warning(f"No rows in the {name} split of {len(rows)} sessions")
+    return order, counts
+
+
+def count_rows(file: Path, header=False) -> Tuple[bytes, int]:
+    """Header line (if any) and row count of a text file, read in blocks"""
+    with open(file, "rb") as f:
+        head = f.readline() if header else b""
+        rows = 0
+        last = b"\n"
+        for block in iter(lambda: f.read(block_size), b""):
+            rows += block.count(b"\n")
+            last = block[-1:]
+        return head, rows + (last != b"\n")
+
+
+def copy_rows(f: BinaryIO, outputs: List[BinaryIO], counts: List[int]):
+    """Copies consecutive runs of counts[i] lines of `f` to outputs[i] in blocks"""
+    split, remaining = 0, counts[0]
+    last = b"\n"
+    for block in iter(lambda: f.read(block_size), b""):
+        pos = 0
+        while pos < len(block):
+            while remaining == 0 and split < len(counts) - 1:
+                split += 1
+                remaining = counts[split]
+            if remaining == 0:
+                return
+            lines = block.count(b"\n", pos)
+            if lines < remaining or (lines == remaining and block[-1:] == b"\n"):
+                outputs[split].write(block[pos:])
+                remaining -= lines
+                last = block[-1:]
+                break
+            end = pos
+            while remaining > 0:
+                end = block.find(b"\n", end) + 1
+                remaining -= 1
+            outputs[split].write(block[pos:end])
+            last = block[end - 1 : end]
+            pos = end
+    if last != b"\n":
+        outputs[split].write(b"\n")
+
+
+def split_text(
+    files: List[Path],
+    outputs: List[Path],
+    header=False,
+    per_session=False,
+    seed: Optional[int] = None,
+):
+    """
+    Splits text files (csv with a shared `header` or header-less vvk) into the
+    train/val/test `outputs` in two streaming passes: one counting rows, one
+    copying byte ranges, so memory does not grow with the corpus.
+    """
+    heads, rows = zip(*[count_rows(file, header) for file in files])
+    assert all(head == heads[0] for head in heads), f"Headers differ in {files}"
+    order, counts = plan_splits(list(rows), per_session, seed)
+    handles = [open(output, "wb") for output in outputs]
+    try:
+        for handle in handles:
+            handle.write(heads[0])
+        for i, file_counts in zip(order, counts):
+            with open(files[i], "rb") as f:
+                if header:
+                    f.readline()
+                copy_rows(f, handles, file_counts)
+    finally:
+        for handle in handles:
+            handle.close()
+    return [sum(file_counts[j] for file_counts in counts) for j in range(3)]
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("files", nargs="+")
+    parser.add_argument(
+        "--per-session",
+        action="store_true",
+        help="split every file 70/10/20 instead of the joined files",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="shuffle whole files with this seed before splitting",
+    )
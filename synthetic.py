@@ -0,0 +1,242 @@
+import argparse
+import csv
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+from scipy.spatial.transform import Rotation, Slerp
+
+from auto_align import alignment_columns
+from gt import load_calib, to_rgb, to_rig
+from imu_gt import R_rgb_phone
+from loaders import aria_imu_columns, euroc_position_columns
+from phone_db import ble_columns, ble_major, imu_aliases
+
+euroc_header = (
+    "#timestamp, "
+    + ", ".join(euroc_position_columns)
+    + ", q_RS_w [], q_RS_x [], q_RS_y [], q_RS_z [], "
+    "v_RS_R_x [m s^-1], v_RS_R_y [m s^-1], v_RS_R_z [m s^-1], "
+    "b_w_RS_S_x [rad s^-1], b_w_RS_S_y [rad s^-1], b_w_RS_S_z [rad s^-1], "
+    "b_a_RS_S_x [m s^-2], b_a_RS_S_y [m s^-2], b_a_RS_S_z [m s^-2]"
+)
+# Aria monotonic clock runs this much slower than real time
+clock_drift = 1 + 2e-6
+real_start = 1.7e9
+session_gap = 60.0
+
+
+class Motion:
+    """Smooth random 3-axis signal, a sum of a few sines per axis"""
+
+    def __init__(self, rng: np.random.Generator, n_waves=8):
+        self.amplitude = rng.uniform(0.2, 2.0, (n_waves, 3))
+        self.frequency = rng.uniform(0.05, 3.0, (n_waves, 3)) * 2 * np.pi
+        self.phase = rng.uniform(0, 2 * np.pi, (n_waves, 3))
+
+    def __call__(self, t):
+        t = np.asarray(t, dtype=np.float64)[:, None]
+        values = np.zeros((len(t), 3))
+        for amplitude, frequency, phase in zip(
+            self.amplitude, self.frequency, self.phase
+        ):
+            values += amplitude * np.sin(frequency * t + phase)
+        return values
+
+
+def write_csv(file: Path, header: str, data, fmt):
+    with open(file, "w") as f:
+        f.write(header + "\n")
+        np.savetxt(f, data, fmt=fmt, delimiter=",")
+
+
+def write_db(file: Path, phone_imu, ble):
+    """Phone .db with the imu and beacon tables phone_db.py queries"""
+    file.unlink(missing_ok=True)
+    with closing(sqlite3.connect(file)) as connection:
+        columns = list(imu_aliases.values())
+        connection.execute(f"CREATE TABLE imu ({', '.join(columns)})")
+        connection.executemany(
+            f"INSERT INTO imu VALUES ({', '.join('?' * len(columns))})",
+            phone_imu.tolist(),
+        )
+        connection.execute(f"CREATE TABLE beacons ({', '.join(ble_columns)})")
+        connection.executemany("INSERT INTO beacons VALUES (?, ?, ?, ?)", ble.tolist())
+        connection.commit()
+
+
+def generate_session(
+    dir: Path,
+    index: int,
+    duration: float,
+    rng: np.random.Generator,
+    calib,
+    aria_rate=800.0,
+    phone_rate=100.0,
+    gt_rate=10.0,
+    db=False,
+) -> Dict[str, float]:
+    """
+    Writes one Aria recording (.euroc GT, _IMU_1.csv, _Time_1.csv) and the
+    phone session recorded alongside it (_imu.csv/_ble.csv exports, or a .db),
+    returns its alignment.csv row. Phone and Aria accelerations share one
+    motion signal so that auto_align.py finds a zero offset, and the phone
+    orientation is the GT one in the frames imu_gt.py uses (`calib` is the
+    (R, T) of gt.load_calib) behind a random constant R_ios_local.
+    """
+    aria_file, db_file = f"aria_{index}", f"phone_{index}.db"
+    mono0 = (10.0 + index * (duration + session_gap)) * 1e9
+    scale, offset = clock_drift / 1e9, real_start
+    motion = Motion(rng)
+
+    mono_sync = mono0 + np.arange(-10.0, duration + 10.0) * 1e9
+    write_csv(
+        dir / f"{aria_file}_Time_1.csv",
+        "timestamp,realtime",
+        np.column_stack([mono_sync, (mono_sync * scale + offset) * 1e9]),
+        "%d",
+    )
+
+    gt_t = np.arange(0.0, duration, 1 / gt_rate)
+    positions = np.column_stack(
+        [3 * np.sin(gt_t / 5), 2 * np.cos(gt_t / 7), 0.1 * np.sin(gt_t / 11)]
+    ) + rng.normal(0, 0.01, (len(gt_t), 3))
+    orientations = Rotation.from_euler(
+        "zyx", np.column_stack([gt_t / 3, np.sin(gt_t) / 5, np.cos(gt_t) / 7])
+    )
+    quats = orientations.as_quat()
+    write_csv(
+        dir / f"{aria_file}.euroc",
+        euroc_header,
+        np.column_stack(
+            [mono0 + gt_t * 1e9, positions, quats[:, [3, 0, 1, 2]]]
+            + [np.zeros((len(gt_t), 9))]
+        ),
+        ["%d"] + ["%.9f"] * 16,
+    )
+
+    aria_t = np.arange(-2.0, duration + 2.0, 1 / aria_rate)
+    aria_imu = np.column_stack(
+        [motion(aria_t), rng.normal(0, 0.1, (len(aria_t), 3))]
+    ) + rng.normal(0, 0.05, (len(aria_t), 6))
+    write_csv(
+        dir / f"{aria_file}_IMU_1.csv",
+        ",".join(["timestamp", *aria_imu_columns]),
+        np.column_stack([mono0 + aria_t * 1e9, aria_imu]),
+        ["%d"] + ["%.6f"] * 6,
+    )
+
+    phone_t = np.arange(-1.0, duration + 1.0, 1 / phone_rate)
+    inside = np.clip(phone_t, gt_t[0], gt_t[-1])
+    R_cam_rgb, T = calib
+    _, local_orientations = to_rgb(
+        *to_rig(positions.copy(), orientations), R_cam_rgb, T
+    )
+    R_ios_local = Rotation.from_euler("xyz", rng.uniform(-np.pi, np.pi, 3))
+    phone_orient = (
+        R_ios_local
+        * Slerp(gt_t, local_orientations)(inside)
+        * (R_cam_rgb * R_rgb_phone)
+    )
+    mag_orient = Rotation.from_rotvec(rng.normal(0, 0.01, (len(phone_t), 3)))
+    mag_orient = mag_orient * phone_orient
+    phone_imu = np.column_stack(
+        [
+            (mono0 + phone_t * 1e9) * scale + offset,
+            phone_orient.as_quat()[:, [3, 0, 1, 2]],
+            mag_orient.as_quat()[:, [3, 0, 1, 2]],
+            motion(phone_t) / -9.8 + rng.normal(0, 0.005, (len(phone_t), 3)),
+            rng.normal(0, 0.1, (len(phone_t), 6)),
+        ]
+    )
+
+    scan_t = phone_imu[0, 0] + 1 + np.arange(int(duration))
+    scan_t = np.floor(scan_t[rng.random(len(scan_t)) > 0.1])
+    n_beacons = rng.integers(1, 6, len(scan_t))
+    ble = np.column_stack(
+        [
+            np.repeat(scan_t, n_beacons),
+            np.full(n_beacons.sum(), ble_major),
+            rng.integers(0, 30, n_beacons.sum()),
+            -rng.integers(40, 90, n_beacons.sum()),
+        ]
+    )
+
+    if db:
+        write_db(dir / db_file, phone_imu, ble)
+    else:
+        write_csv(
+            dir / f"{db_file}_imu.csv",
+            ",".join(imu_aliases),
+            phone_imu,
+            ["%.6f"] + ["%.9f"] * 17,
+        )
+        write_csv(dir / f"{db_file}_ble.csv", ",".join(ble_columns), ble, "%d")
+    return {
+        "db_file": db_file,
+        "aria_file": aria_file,
+        "scale": scale,
+        "offset": offset,
+        "db_offset": 0.0,
+        "aria_offset": 0.0,
+        "confidence": 1.0,
+    }
+
+
+def generate(dir: Path, sessions=1, duration=600.0, seed=0, **kwargs) -> Path:
+    """
+    Writes `sessions` sessions of `duration` seconds and their alignment.csv
+    into `dir`, returns the alignment.csv. `kwargs` go to generate_session.
+    """
+    dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    calib = load_calib()
+    rows = [
+        generate_session(dir, i, duration, rng, calib, **kwargs)
+        for i in range(sessions)
+    ]
+    with open(dir / "alignment.csv", "w") as alignment_file:
+        writer = csv.DictWriter(alignment_file, fieldnames=alignment_columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return dir / "alignment.csv"
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=600.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--aria-rate", type=float, default=800.0, help="Hz")
+    parser.add_argument("--phone-rate", type=float, default=100.0, help="Hz")
+    parser.add_argument("--gt-rate", type=float, default=10.0, help="Hz")
+    parser.add_argument(
+        "--db", action="store_true", help="write phone .db files, not csv exports"
+    )
+
+
+def session_kwargs(args) -> Dict:
+    return {
+        "aria_rate": args.aria_rate,
+        "phone_rate": args.phone_rate,
+        "gt_rate": args.gt_rate,
+        "db": args.db,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Writes synthetic Aria/phone sessions with an alignment.csv"
+    )
+    parser.add_argument("dir")
+    add_arguments(parser)
+    args = parser.parse_args()
+    alignment = generate(
+        Path(args.dir).resolve(),
+        args.sessions,
+        args.duration,
+        args.seed,
+        **session_kwargs(args),
+    )
+    print("Wrote", alignment)
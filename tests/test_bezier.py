@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from bezier import BezierSpline
+
+
+def test_two_knot_spline_is_the_straight_segment():
+    spline = BezierSpline.fit([1.0, 2.0], [[1.0, 10.0], [2.0, 20.0]])
+    assert np.allclose(
+        spline([1.0, 1.25, 1.5]), [[1.0, 10.0], [1.25, 12.5], [1.5, 15.0]]
+    )
+
+
+@pytest.mark.parametrize("n_points", [0, 1])
+def test_fewer_than_two_points_raise(n_points):
+    with pytest.raises(ValueError):
+        BezierSpline.fit(np.arange(n_points, dtype=float), np.zeros((n_points, 2)))
@@ -0,0 +1,34 @@
+import numpy as np
+
+from ble_gt import group_scans
+
+
+def test_group_scans_keeps_every_reading_and_fills_gaps():
+    # (timestamp, major, minor, rssi), out of order within the file
+    readings = np.array(
+        [
+            [0.0, 9, 1, -50],
+            [0.0, 9, 2, -51],
+            [1.0, 9, 4, -53],
+            [0.0, 9, 3, -52],
+            [4.5, 9, 5, -54],
+            [4.5, 9, 6, -55],
+        ]
+    )
+    scan_times, offsets, minor, rssi, missing = group_scans(readings)
+
+    # 1.0 -> 4.5 is 2.3 s over max_gap: three empty scans a second apart
+    assert missing.tolist() == [0, 3, 0]
+    assert scan_times.tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 4.5]
+    assert offsets.tolist() == [0, 3, 4, 4, 4, 4, 6]
+    # The first reading of each scan and the final scan are kept
+    assert minor.tolist() == [1, 2, 3, 4, 5, 6]
+    assert rssi.tolist() == [-50, -51, -52, -53, -54, -55]
+
+
+def test_group_scans_fills_gaps_over_max_gap_only():
+    readings = np.array([[0.0, 9, 1, -50], [1.0, 9, 2, -51], [3.0, 9, 3, -52]])
+    scan_times, offsets, _, _, missing = group_scans(readings)
+    assert missing.tolist() == [0, 1, 0]
+    assert scan_times.tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert offsets.tolist() == [0, 1, 2, 2, 3]
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import numpy as np
+
+import imu_gt
+import synthetic
+from gt import load_calib
+from loaders import read_columns, read_header
+
+# Every 20th row and the last of traj_0.csv as written by the per-row imu_gt
+# loop (c5baf1f) for the session below
+reference = Path(__file__).parent / "data" / "imu_gt_reference.csv"
+reference_rows = list(range(0, 198, 20)) + [197]
+
+
+def test_traj_matches_per_row_reference(tmp_path):
+    alignment = synthetic.generate(
+        tmp_path, 1, 10.0, 0, aria_rate=200.0, phone_rate=20.0
+    )
+    R, T = load_calib()
+    imu_gt.process(alignment, R, T)
+
+    traj = tmp_path / "traj_0.csv"
+    header = read_header(reference)
+    assert read_header(traj) == header == imu_gt.output_columns
+    data = read_columns(traj, header)
+    assert len(data) == 198
+    # The reference was written with %.9g
+    assert np.allclose(
+        data[reference_rows], read_columns(reference, header), rtol=1e-8, atol=1e-9
+    )
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from loaders import read_columns
+from writers import write_table
+
+columns = ["timestamp", "processedPosX"]
+
+
+@pytest.mark.parametrize("suffix", ["csv", "npz", "parquet", "feather"])
+def test_read_columns_stops_at_max_rows(tmp_path, suffix):
+    chunks = [
+        np.column_stack([np.arange(start, start + 100.0), np.arange(100.0) / 10])
+        for start in range(0, 500, 100)
+    ]
+    file = tmp_path / f"traj_0.{suffix}"
+    write_table(file, columns, iter(chunks))
+
+    data = read_columns(file, columns, 250)
+    assert np.array_equal(data, np.concatenate(chunks)[:250])
+    assert len(read_columns(file, columns, 1000)) == 500
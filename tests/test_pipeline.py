@@ -0,0 +1,77 @@
+import numpy as np
+
+import pipeline
+from loaders import alignment_confidence, read_alignment
+from writers import write_table
+
+
+def align_result(db_file, db_offset):
+    return {
+        "db_file": db_file,
+        "aria_file": db_file + "_aria",
+        "scale": 1.0,
+        "offset": 0.0,
+        "db_offset": db_offset,
+        "aria_offset": 0.0,
+        "confidence": 0.05,
+    }
+
+
+def align_state(dir, db_files, db_offset):
+    stages = [
+        pipeline.Stage(dir, f"align:{db_file}", [], [], {}, None)
+        for db_file in db_files
+    ]
+    state = {
+        stage.key: {
+            "params": {},
+            "inputs": {},
+            "result": align_result(db_file, db_offset),
+        }
+        for stage, db_file in zip(stages, db_files)
+    }
+    return stages, state
+
+
+def test_write_alignment_keeps_baseline_rows(tmp_path):
+    # Layout run.sh wrote before auto_align: no confidence column
+    (tmp_path / "alignment.csv").write_text(
+        "db_file,aria_file,scale,offset,db_offset,aria_offset\n"
+        "a.db, a_aria, 1.0, 0.0, 0.5, 0.0\n"
+    )
+    stages, state = align_state(tmp_path, ["a.db", "b.db"], 1.5e-05)
+
+    rows = read_alignment(pipeline.write_alignment(tmp_path, stages, state))
+    assert [row["db_file"] for row in rows] == ["a.db", "b.db"]
+    assert float(rows[0]["db_offset"]) == 0.5
+    assert alignment_confidence(rows[0]) == 1.0
+    assert alignment_confidence(rows[1]) == 0.05
+
+    auto = read_alignment(tmp_path / "alignment.auto.csv")
+    assert [float(row["db_offset"]) for row in auto] == [1.5e-05, 1.5e-05]
+
+    rows = read_alignment(
+        pipeline.write_alignment(tmp_path, stages, state, realign=True)
+    )
+    assert [float(row["db_offset"]) for row in rows] == [1.5e-05, 1.5e-05]
+
+
+def test_split_stages_order_trajectories_by_time(tmp_path):
+    # Truth indices follow the .db names, not the recording times
+    starts = [5, 11, 0, 7, 2, 9, 4, 10, 1, 8, 3, 6]
+    for truth_idx, start in enumerate(starts):
+        timestamps = 100.0 * start + np.arange(10.0)
+        write_table(
+            tmp_path / f"traj_{truth_idx}.csv",
+            ["timestamp", "iphoneAccX"],
+            [np.column_stack([timestamps, timestamps])],
+        )
+        (tmp_path / f"traj_{truth_idx}.vvk").write_text(
+            f"{timestamps[0]}:0.0,0.0,0.0:1,-70\n"
+        )
+
+    (stage,) = pipeline.split_stages(tmp_path, "csv", "vvk")
+    imu_files, ble_files = stage.args
+    order = np.argsort(starts).tolist()
+    assert [file.name for file in imu_files] == [f"traj_{i}.csv" for i in order]
+    assert [file.name for file in ble_files] == [f"traj_{i}.vvk" for i in order]
@@ -0,0 +1,66 @@
+import numpy as np
+
+import split_imu
+from loaders import read_columns
+from splits import plan_splits
+from writers import write_table
+
+columns = ["timestamp", "iphoneAccX"]
+
+
+def write_traj(file, start, rows):
+    timestamps = np.arange(start, start + rows, dtype=np.float64)
+    write_table(file, columns, [np.column_stack([timestamps, timestamps / 10])])
+    return file
+
+
+def test_seeded_npz_split_writes_empty_splits(tmp_path):
+    dir = tmp_path / "session"
+    dir.mkdir()
+    files = [
+        write_traj(dir / "traj_0.npz", 0, 100),
+        write_traj(dir / "traj_1.npz", 100, 50),
+    ]
+    # Whole sessions cannot fill all three splits
+    rows = split_imu.split_files(files, seed=1)
+    assert sum(rows) == 150 and 0 in rows
+
+    counts = []
+    for name in split_imu.split_names:
+        data = read_columns(dir / "session_npz" / name / "traj_0.npz", columns)
+        assert data.shape[1] == len(columns)
+        counts.append(len(data))
+    assert counts == rows
+
+
+def test_seeded_csv_split_fills_every_split(tmp_path):
+    dir = tmp_path / "session"
+    dir.mkdir()
+    sizes = [500, 30, 40, 60, 300, 200, 10]
+    files, start = [], 0
+    for i, size in enumerate(sizes):
+        files.append(write_traj(dir / f"traj_{i}.csv", start, size))
+        start += size
+
+    for seed in range(5):
+        rows = split_imu.split_files(files, seed=seed)
+        # 70/10/20 of 1140 rows is 798/114/228
+        assert rows == [800, 110, 230]
+        timestamps = []
+        for name, count in zip(split_imu.split_names, rows):
+            data = read_columns(dir / "session_csv" / name / "traj_0.csv", columns)
+            assert len(data) == count
+            timestamps.append(data[:, 0])
+        assert np.array_equal(np.sort(np.concatenate(timestamps)), np.arange(1140))
+
+
+def test_seeded_split_gives_val_and_test_a_session(caplog):
+    for seed in range(10):
+        _, counts = plan_splits([1000, 10, 10], seed=seed)
+        assert [sum(c[j] for c in counts) for j in range(3)] == [1000, 10, 10]
+        assert all(sum(c) == max(c) for c in counts)
+
+    # Two sessions cannot fill three splits, the empty one is reported
+    _, counts = plan_splits([60, 58], seed=3)
+    assert sorted(sum(c[j] for c in counts) for j in range(3)) == [0, 58, 60]
+    assert "No rows in the val split" in caplog.text
@@ -0,0 +1,148 @@
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from fingerprints import write_vvb
+
+binary_formats = ["feather", "parquet", "npz"]
+
+
+def row_format(
+    columns: List[str], precision: int = 9, formats: Optional[Dict[str, str]] = None
+) -> str:
+    """printf-style format of one csv row, `formats` overrides single columns"""
+    formats = formats or {}
+    return (
+        ",".join([formats.get(column, f"%.{precision}g") for column in columns]) + "\n"
+    )
+
+
+def write_csv(
+    file: Path,
+    columns: List[str],
+    chunks: Iterable[np.ndarray],
+    precision: int = 9,
+    formats: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    Streams (n, len(columns)) float chunks to a csv file, formatting each chunk
+    with a single string operation. Returns the number of rows written.
+    """
+    fmt = row_format(columns, precision, formats)
+    rows = 0
+    with open(file, "w+") as outfile:
+        outfile.write(",".join(columns) + "\n")
+        for chunk in chunks:
+            assert chunk.ndim == 2 and chunk.shape[1] == len(columns), chunk.shape
+            outfile.write((fmt * len(chunk)) % tuple(chunk.ravel().tolist()))
+            rows += len(chunk)
+    return rows
+
+
+def write_arrow(file: Path, columns: List[str], chunks: Iterable[np.ndarray]) -> int:
+    """Streams float chunks as record batches of a float64 feather/parquet file"""
+    import pyarrow as pa
+
+    schema = pa.schema([(column, pa.float64()) for column in columns])
+    if file.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(file, schema)
+    else:
+        writer = pa.ipc.new_file(file, schema)
+    rows = 0
+    with writer:
+        for chunk in chunks:
+            assert chunk.ndim == 2 and chunk.shape[1] == len(columns), chunk.shape
+            writer.write_table(pa.Table.from_arrays(list(chunk.T), schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+def write_npz(file: Path, columns: List[str], chunks: Iterable[np.ndarray]) -> int:
+    """
+    Writes float chunks as one array per column of an npz archive, empty
+    columns if there are no chunks
+    """
+    data = np.concatenate([np.empty((0, len(columns))), *chunks], axis=0)
+    np.savez(file, **{column: data[:, i] for i, column in enumerate(columns)})
+    return len(data)
+
+
+def write_table(
+    file: Path,
+    columns: List[str],
+    chunks: Iterable[np.ndarray],
+    precision: int = 9,
+    formats: Optional[Dict[str, str]] = None,
+) -> int:
+    """Writes float chunks in the format given by the suffix of `file`"""
+    if file.suffix in (".feather", ".parquet"):
+        return write_arrow(file, columns, chunks)
+    elif file.suffix == ".npz":
+        return write_npz(file, columns, chunks)
+    return write_csv(file, columns, chunks, precision, formats)
+
+
+def write_vvk(file: Path, timestamps, positions, offsets, minor, rssi) -> int:
+    """Writes BLE scans as `timestamp:x,y,z:minor,rssi;minor,rssi...` lines"""
+    readings = list(
+        map("{},{}".format, np.asarray(minor).tolist(), np.asarray(rssi).tolist())
+    )
+    offsets = np.asarray(offsets).tolist()
+    beacons = [";".join(readings[a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
+    with open(file, "w+") as outfile:
+        outfile.writelines(
+            map(
+                "{}:{},{},{}:{}\n".format,
+                np.asarray(timestamps).tolist(),
+                *np.asarray(positions).T.tolist(),
+                beacons,
+            )
+        )
+    return len(beacons)
+
+
+def write_ble_table(file: Path, timestamps, positions, offsets, minor, rssi) -> int:
+    """
+    Writes BLE scans in the format given by the suffix of `file`. Scan i holds
+    the readings minor[offsets[i]:offsets[i + 1]], rssi[...], stored as list
+    columns for feather/parquet, as flat arrays plus offsets for npz, as text
+    lines for vvk and as fixed-width records for vvb.
+    """
+    if file.suffix == ".vvk":
+        return write_vvk(file, timestamps, positions, offsets, minor, rssi)
+    if file.suffix == ".vvb":
+        return write_vvb(file, timestamps, positions, offsets, minor, rssi)
+    columns = {
+        "timestamp": np.asarray(timestamps, dtype=np.float64),
+        "processedPosX": positions[:, 0],
+        "processedPosY": positions[:, 1],
+        "processedPosZ": positions[:, 2],
+    }
+    offsets = np.asarray(offsets, dtype=np.int32)
+    minor = np.asarray(minor, dtype=np.int32)
+    rssi = np.asarray(rssi, dtype=np.int32)
+    if file.suffix == ".npz":
+        np.savez(file, offsets=offsets, minor=minor, rssi=rssi, **columns)
+        return len(timestamps)
+
+    import pyarrow as pa
+
+    table = pa.table(
+        {
+            **columns,
+            "minor": pa.ListArray.from_arrays(offsets, minor),
+            "rssi": pa.ListArray.from_arrays(offsets, rssi),
+        }
+    )
+    if file.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, file)
+    else:
+        import pyarrow.feather as feather
+
+        feather.write_feather(table, file)
+    return len(timestamps)